@@ -0,0 +1,91 @@
+# benchmarks/transcode_cpu.py
+"""CPU cost per concurrent voice stream: live ffmpeg decode vs. pre-transcoded PCM.
+
+"piped" starts one real-time ffmpeg decode per stream, as AudioPiped does.
+"pcm" reads a file that has already been transcoded, at the same real-time
+rate, which is all that is left to do when MEDIA_TRANSCODE is on.
+
+    python -m benchmarks.transcode_cpu song.webm --streams 1 10 50 --seconds 20
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+from bot.core.transcode import PCM_BYTES_PER_SECOND, ffmpeg_pcm_args, transcode_to_pcm
+
+# The voice client consumes 20 ms frames
+FRAME_SECONDS = 0.02
+FRAME_BYTES = int(PCM_BYTES_PER_SECOND * FRAME_SECONDS)
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+async def _piped_stream(source: str, seconds: float):
+    # -re paces the decode at playback speed, like a live stream
+    args = ffmpeg_pcm_args(source)
+    args.insert(args.index("-i"), "-re")
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            if not await proc.stdout.read(FRAME_BYTES * 50):
+                break
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+
+async def _pcm_stream(path: str, seconds: float):
+    start = time.monotonic()
+    frames = 0
+    with open(path, "rb") as f:
+        while time.monotonic() - start < seconds:
+            if not f.read(FRAME_BYTES):
+                f.seek(0)
+            frames += 1
+            await asyncio.sleep(max(0.0, start + frames * FRAME_SECONDS - time.monotonic()))
+
+
+async def _measure(make_stream, streams: int, seconds: float) -> float:
+    """Returns CPU seconds used per stream per second of playback."""
+    cpu = _cpu_seconds()
+    started = time.monotonic()
+    await asyncio.gather(*(make_stream() for _ in range(streams)))
+    elapsed = time.monotonic() - started
+    return (_cpu_seconds() - cpu) / elapsed / streams
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="a downloaded track, in any format ffmpeg reads")
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 10, 25])
+    parser.add_argument("--seconds", type=float, default=15.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # transcode_to_pcm() deletes its input, so give it a copy
+        copy = os.path.join(tmp, "track" + os.path.splitext(args.source)[1])
+        with open(args.source, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        pcm = transcode_to_pcm(copy)
+
+        print(f"{'streams':>8} {'piped cpu/stream':>18} {'pcm cpu/stream':>16} {'ratio':>7}")
+        for streams in args.streams:
+            piped = await _measure(lambda: _piped_stream(args.source, args.seconds), streams, args.seconds)
+            raw = await _measure(lambda: _pcm_stream(pcm, args.seconds), streams, args.seconds)
+            ratio = piped / raw if raw else float("inf")
+            print(f"{streams:>8} {piped * 100:>17.2f}% {raw * 100:>15.2f}% {ratio:>6.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,10 @@
+# bot/__main__.py
+# Entry point: python -m bot
+#
+# Worker processes are started with "spawn", which re-imports the main module
+# in every child. Keeping the import of bot.main behind this check means the
+# children never read the config or set up logging again.
+if __name__ == "__main__":
+    from bot.main import run
+
+    run()
@@ -0,0 +1,95 @@
+# bot/core/activity.py
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from loguru import logger
+
+from bot.core.database import Database
+
+
+class ActivityBuffer:
+    """Aggregates per-message activity in memory and writes it to the database in batches.
+
+    Every message only bumps a counter in a dict keyed by (chat_id, user_id, hour).
+    The hour keeps the hourly and daily rollups exact when a batch spans an hour boundary.
+    The whole dict is flushed as one batched upsert either every `flush_interval`
+    seconds or as soon as it holds `max_size` distinct keys, whichever comes first.
+    """
+
+    def __init__(self, db: Database, flush_interval: float = 10.0, max_size: int = 5000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        # (chat_id, user_id, hour_bucket) -> [message_count, last_message_timestamp]
+        self._pending: dict = {}
+        self._last_prune = 0.0
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+        self._size_flush: asyncio.Task = None
+
+    def record(self, chat_id: int, user_id: int):
+        """Counts one message. Never touches the database."""
+        now = datetime.now(timezone.utc)
+        key = (chat_id, user_id, now.replace(minute=0, second=0, microsecond=0))
+        entry = self._pending.get(key)
+        if entry:
+            entry[0] += 1
+            entry[1] = now
+        else:
+            self._pending[key] = [1, now]
+
+        if len(self._pending) >= self.max_size and not (self._size_flush and not self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Writes everything buffered so far in a single round trip."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+
+            rows = [(chat_id, user_id, count, ts, bucket) for (chat_id, user_id, bucket), (count, ts) in batch.items()]
+            try:
+                await self.db.log_user_activity_batch(rows)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(rows)} activity rows: {e}")
+                # Put the counts back so they go out with the next flush
+                for key, (count, ts) in batch.items():
+                    entry = self._pending.get(key)
+                    if entry:
+                        entry[0] += count
+                        entry[1] = max(entry[1], ts)
+                    else:
+                        self._pending[key] = [count, ts]
+
+    async def prune(self):
+        """Drops expired rollup buckets, at most once an hour."""
+        now = time.monotonic()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        try:
+            await self.db.prune_activity_rollups()
+        except Exception as e:
+            logger.error(f"Failed to prune activity rollups: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.prune()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the periodic flush and writes out whatever is still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,83 @@
+# bot/core/chat_config.py
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from bot.core.cache import LRUCache
+
+# Postgres channel used to tell every bot instance that a chat's config changed.
+# The payload is the chat_id as text.
+CONFIG_CHANNEL = "chat_config"
+
+# chat_id -> decoded groups.config (a dict, {} for unknown chats)
+chat_configs = LRUCache(maxsize=10000, ttl=300)
+
+
+def invalidate_chat_config(chat_id: int):
+    """Drops a chat's config from this process' cache."""
+    chat_configs.pop(chat_id)
+
+
+class ConfigListener:
+    """Keeps one connection LISTENing on CONFIG_CHANNEL and invalidates the cache on every NOTIFY.
+
+    The connection is its own, outside the pool, so a dropped LISTEN
+    connection never costs the pool a slot. `connect_kwargs` are passed
+    to asyncpg.connect().
+    """
+
+    def __init__(self, **connect_kwargs):
+        self.connect_kwargs = connect_kwargs
+        self._conn: asyncpg.Connection = None
+        self._reconnect_task: asyncio.Task = None
+        self._stopping = False
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            invalidate_chat_config(int(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed {CONFIG_CHANNEL} notification: {payload!r}")
+
+    def _on_terminate(self, conn):
+        if self._stopping:
+            return
+        # Notifications may have been missed while the connection was down
+        logger.warning("Config listener connection lost, clearing chat config cache.")
+        chat_configs.clear()
+        self._conn = None
+        conn.terminate()
+        if not (self._reconnect_task and not self._reconnect_task.done()):
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+        while not self._stopping and self._conn is None:
+            try:
+                await self.start()
+            except Exception as e:
+                logger.error(f"Config listener reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    async def start(self):
+        conn = await asyncpg.connect(**self.connect_kwargs)
+        try:
+            await conn.add_listener(CONFIG_CHANNEL, self._on_notify)
+        except Exception:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._on_terminate)
+        self._conn = conn
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+        if self._conn:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.remove_listener(CONFIG_CHANNEL, self._on_notify)
+            finally:
+                await conn.close()
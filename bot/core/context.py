@@ -0,0 +1,73 @@
+# bot/core/context.py
+from typing import Optional
+
+from pyrogram.types import Message
+
+from bot.core.cache import MISSING
+from bot.core.chat_config import chat_configs
+from bot.core.database import Role, member_roles
+from bot.core.filter_index import TriggerIndex, filter_indexes
+
+
+class ChatContext:
+    """Everything the per-message handlers need to know about a chat and its sender.
+
+    Loaded once per update and attached to the message as `message.chat_context`,
+    so every handler group reads the same snapshot.
+    """
+
+    def __init__(self, chat_id: int, user_id: Optional[int], config: dict, role: Optional[Role], filter_index: TriggerIndex):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.config = config
+        self.role = role
+        self.filter_index = filter_index
+
+    @property
+    def locks(self) -> dict:
+        return self.config.get("locks") or {}
+
+    @property
+    def banned_names(self) -> list:
+        return self.config.get("banned_names") or []
+
+    def has_role(self, required_role: Role) -> bool:
+        return self.role is not None and self.role.value >= required_role.value
+
+
+async def get_chat_context(client: "Bot", message: Message) -> ChatContext:
+    """Returns the message's context, loading it on first use.
+
+    Whatever is not already cached is fetched in a single round trip,
+    and the results are put back into the individual caches.
+    """
+    context = getattr(message, "chat_context", None)
+    if context is not None:
+        return context
+
+    chat_id = message.chat.id
+    user_id = message.from_user.id if message.from_user else None
+
+    config = chat_configs.get(chat_id)
+    role = member_roles.get((chat_id, user_id), MISSING) if user_id else None
+    filter_index = filter_indexes.get(chat_id)
+
+    need_config = config is None
+    need_role = role is MISSING
+    need_filters = filter_index is None
+
+    if need_config or need_role or need_filters:
+        row = await client.db.load_chat_context(chat_id, user_id, need_config, need_role, need_filters)
+        if need_config:
+            config = row["config"] or {}
+            chat_configs.set(chat_id, config)
+        if need_role:
+            role = Role[row["role"].upper()] if row["role"] else None
+            member_roles.set((chat_id, user_id), role)
+        if need_filters:
+            filter_index = TriggerIndex(row["filter_names"])
+            filter_indexes.set(chat_id, filter_index)
+
+    context = ChatContext(chat_id, user_id, config, role, filter_index)
+    message.chat_context = context
+    return context
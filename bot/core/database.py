@@ -1,229 +1,496 @@
 import asyncpg
 from typing import Optional
 import json
+import time
+from datetime import datetime, timedelta, timezone
 
 from enum import Enum
 
+from loguru import logger
+
+from bot.core.cache import LRUCache, MISSING
+from bot.core.filter_index import trigger_added, trigger_removed
+from bot.core.chat_config import CONFIG_CHANNEL, chat_configs, invalidate_chat_config
+from bot.core.metrics import Histogram
+
+async def init_connection(conn: asyncpg.Connection):
+    """Runs for every new pool connection. Makes asyncpg encode and decode json/jsonb natively."""
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+
 class Role(Enum):
     ASSISTANT = 1
     ADMIN = 2
     MANAGER = 3
     OWNER = 4
 
-async def add_user_if_not_exists(pool: asyncpg.Pool, user_id: int, first_name: str, username: Optional[str], is_bot: bool):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO users (user_id, first_name, username, is_bot)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (user_id) DO NOTHING;
-            """,
-            user_id, first_name, username, is_bot
-        )
+# user_id -> fingerprint of (first_name, username) as last written to the database.
+# A hit means the users row is already up to date, so the upsert can be skipped.
+known_users = LRUCache(maxsize=50000)
 
-async def add_group_if_not_exists(pool: asyncpg.Pool, chat_id: int, title: str):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO groups (chat_id, title)
-            VALUES ($1, $2)
-            ON CONFLICT (chat_id) DO NOTHING;
-            """,
-            chat_id, title
-        )
+# (chat_id, user_id) -> Role, or None for members without a role.
+# Caching the None results matters most, since most senders have no role.
+member_roles = LRUCache(maxsize=100000, ttl=600)
 
-async def set_member_role(pool: asyncpg.Pool, user_id: int, chat_id: int, role: Role):
-    role_name_str = role.name.lower()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO group_members (user_id, chat_id, role)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (user_id, chat_id)
-            DO UPDATE SET role = EXCLUDED.role;
-            """,
-            user_id, chat_id, role_name_str
-        )
+# Periods accepted by /stats and /topusers: which rollup answers them and how far back
+ACTIVITY_PERIODS = {
+    "24h": ("hourly", timedelta(hours=24)),
+    "7d": ("daily", timedelta(days=7)),
+    "30d": ("daily", timedelta(days=30)),
+}
 
-async def get_member_role(pool: asyncpg.Pool, user_id: int, chat_id: int) -> Optional[Role]:
-    async with pool.acquire() as conn:
-        role_str = await conn.fetchval(
-            "SELECT role FROM group_members WHERE user_id = $1 AND chat_id = $2",
-            user_id, chat_id
-        )
-        if role_str:
-            return Role[role_str.upper()]
-    return None
-
-async def remove_member_role(pool: asyncpg.Pool, user_id: int, chat_id: int):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "DELETE FROM group_members WHERE user_id = $1 AND chat_id = $2",
-            user_id, chat_id
-        )
+# Rollup rows older than this are pruned; a little longer than the longest period
+HOURLY_RETENTION = timedelta(days=2)
+DAILY_RETENTION = timedelta(days=32)
 
+def _period_start(period: str) -> tuple:
+    """Returns (granularity, first bucket) covering the period, current bucket included."""
+    granularity, span = ACTIVITY_PERIODS[period]
+    now = datetime.now(timezone.utc)
+    if granularity == "hourly":
+        current = now.replace(minute=0, second=0, microsecond=0)
+        return granularity, current - span + timedelta(hours=1)
+    current = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return granularity, current - span + timedelta(days=1)
 
-# Add this to the end of bot/core/database.py
-async def add_warning_and_get_count(pool: asyncpg.Pool, user_id: int, chat_id: int, warner_id: int) -> int:
-    """Adds a warning and returns the new total warning count for the user in that chat."""
-    async with pool.acquire() as conn:
-        # Add the new warning
-        await conn.execute(
-            "INSERT INTO warnings (user_id, chat_id, warner_id) VALUES ($1, $2, $3)",
-            user_id, chat_id, warner_id
-        )
-        # Get the new total count
-        count = await conn.fetchval(
-            "SELECT COUNT(*) FROM warnings WHERE user_id = $1 AND chat_id = $2",
-            user_id, chat_id
+def get_user_cache_stats() -> dict:
+    """Returns size and hit/miss counters of the known-users cache."""
+    return known_users.stats()
+
+# --- Statements ---
+# Every query the bot runs, by name. asyncpg prepares each one once per connection
+# and reuses it from its statement cache, so the text must stay constant.
+
+STATEMENTS = {
+    # New users are inserted, known users only get rewritten when their name changed
+    "add_user": """
+        INSERT INTO users (user_id, first_name, username, is_bot)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id) DO UPDATE SET
+        first_name = EXCLUDED.first_name,
+        username = EXCLUDED.username
+        WHERE users.first_name IS DISTINCT FROM EXCLUDED.first_name
+        OR users.username IS DISTINCT FROM EXCLUDED.username;
+    """,
+    "add_group": """
+        INSERT INTO groups (chat_id, title)
+        VALUES ($1, $2)
+        ON CONFLICT (chat_id) DO NOTHING;
+    """,
+    "set_member_role": """
+        INSERT INTO group_members (user_id, chat_id, role)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, chat_id)
+        DO UPDATE SET role = EXCLUDED.role;
+    """,
+    "get_member_role": "SELECT role FROM group_members WHERE user_id = $1 AND chat_id = $2",
+    "remove_member_role": "DELETE FROM group_members WHERE user_id = $1 AND chat_id = $2",
+    # A CTE can't see the row it inserts, hence the + 1
+    "add_warning": """
+        WITH inserted AS (
+            INSERT INTO warnings (user_id, chat_id, warner_id) VALUES ($1, $2, $3)
         )
-        return count
-    
-# Add these to the end of bot/core/database.py
-
-async def set_group_lock(pool: asyncpg.Pool, chat_id: int, lock_type: str, status: bool):
-    """Sets a specific lock type to true or false for a group."""
-    async with pool.acquire() as conn:
-        # This query updates the 'locks' object within the 'config' JSONB column.
-        # The '||' operator merges JSON objects.
-        await conn.execute(
-            """
+        SELECT COUNT(*) + 1 FROM warnings WHERE user_id = $1 AND chat_id = $2;
+    """,
+    "get_chat_config": "SELECT config FROM groups WHERE chat_id = $1",
+    # The NOTIFY tells other bot instances to drop their cached copy of the config.
+    # The '||' operator merges JSON objects.
+    "set_group_lock": f"""
+        WITH updated AS (
             UPDATE groups
             SET config = config || jsonb_build_object('locks', jsonb_build_object($1::text, $2::boolean))
-            WHERE chat_id = $3;
-            """,
-            lock_type, status, chat_id
-        )
-
-async def get_group_locks(pool: asyncpg.Pool, chat_id: int) -> dict:
-    """Gets the lock configuration for a group."""
-    async with pool.acquire() as conn:
-        # This query now fetches only the 'locks' object from the JSON
-        locks_str = await conn.fetchval(
-            "SELECT config -> 'locks' FROM groups WHERE chat_id = $1",
-            chat_id
-        )
-        # asyncpg returns json as a string, so we must parse it
-        if locks_str:
-            return json.loads(locks_str)
-        return {}
-
-# Add these to the end of bot/core/database.py
-
-async def add_filter(pool: asyncpg.Pool, chat_id: int, filter_name: str, reply_text: str, reply_type: str, file_id: str):
-    """Adds a new filter to the database."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO filters (chat_id, filter_name, reply_text, reply_type, file_id)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (chat_id, filter_name) DO UPDATE SET
-            reply_text = EXCLUDED.reply_text,
-            reply_type = EXCLUDED.reply_type,
-            file_id = EXCLUDED.file_id;
-            """,
-            chat_id, filter_name, reply_text, reply_type, file_id
+            WHERE chat_id = $3
+            RETURNING chat_id
         )
-
-async def remove_filter(pool: asyncpg.Pool, chat_id: int, filter_name: str):
-    """Removes a filter from the database."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "DELETE FROM filters WHERE chat_id = $1 AND filter_name = $2",
-            chat_id, filter_name
-        )
-
-async def get_all_filters(pool: asyncpg.Pool, chat_id: int):
-    """Gets all filters for a specific chat."""
-    async with pool.acquire() as conn:
-        return await conn.fetch("SELECT * FROM filters WHERE chat_id = $1", chat_id)
-    
-
-# Add these to the end of bot/core/database.py
-
-async def add_banned_name_pattern(pool: asyncpg.Pool, chat_id: int, pattern: str):
-    """Adds a new banned name pattern for a group."""
-    async with pool.acquire() as conn:
-        # This query appends a new pattern to the 'banned_names' array in the config
-        await conn.execute(
-            """
+        SELECT pg_notify('{CONFIG_CHANNEL}', chat_id::text) FROM updated;
+    """,
+    "add_banned_name": f"""
+        WITH updated AS (
             UPDATE groups
             SET config = jsonb_set(
                 config,
-                '{banned_names}',
+                '{{banned_names}}',
                 (COALESCE(config->'banned_names', '[]'::jsonb) || $1::jsonb),
                 true
             )
-            WHERE chat_id = $2;
-            """,
-            f'"{pattern}"', chat_id
+            WHERE chat_id = $2
+            RETURNING chat_id
         )
-
-async def remove_banned_name_pattern(pool: asyncpg.Pool, chat_id: int, pattern: str):
-    """Removes a banned name pattern from a group."""
-    async with pool.acquire() as conn:
-        # This query removes a specific element from the 'banned_names' array
-        await conn.execute(
-            """
+        SELECT pg_notify('{CONFIG_CHANNEL}', chat_id::text) FROM updated;
+    """,
+    "remove_banned_name": f"""
+        WITH updated AS (
             UPDATE groups
             SET config = jsonb_set(
                 config,
-                '{banned_names}',
+                '{{banned_names}}',
                 (config->'banned_names') - $1
             )
-            WHERE chat_id = $2;
-            """,
-            pattern, chat_id
+            WHERE chat_id = $2
+            RETURNING chat_id
         )
-
-async def get_banned_name_patterns(pool: asyncpg.Pool, chat_id: int) -> list:
-    """Gets the list of banned name patterns for a group."""
-    async with pool.acquire() as conn:
-        patterns_json = await conn.fetchval(
-            "SELECT config -> 'banned_names' FROM groups WHERE chat_id = $1",
-            chat_id
-        )
-        if patterns_json:
-            return json.loads(patterns_json)
-        return []
-    
-
-# Add these to the end of bot/core/database.py
-
-async def log_user_activity(pool: asyncpg.Pool, chat_id: int, user_id: int):
-    """Logs a message from a user, incrementing their count."""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO group_activity (chat_id, user_id)
-            VALUES ($1, $2)
+        SELECT pg_notify('{CONFIG_CHANNEL}', chat_id::text) FROM updated;
+    """,
+    "add_filter": """
+        INSERT INTO filters (chat_id, filter_name, reply_text, reply_type, file_id)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (chat_id, filter_name) DO UPDATE SET
+        reply_text = EXCLUDED.reply_text,
+        reply_type = EXCLUDED.reply_type,
+        file_id = EXCLUDED.file_id;
+    """,
+    "remove_filter": "DELETE FROM filters WHERE chat_id = $1 AND filter_name = $2",
+    "get_filter_names": "SELECT filter_name FROM filters WHERE chat_id = $1 ORDER BY filter_name",
+    "get_filter": "SELECT reply_text, reply_type, file_id FROM filters WHERE chat_id = $1 AND filter_name = $2",
+    # Only the parts that aren't cached yet are fetched
+    "load_chat_context": """
+        SELECT
+            CASE WHEN $3 THEN (SELECT config FROM groups WHERE chat_id = $1) END AS config,
+            CASE WHEN $4 THEN (SELECT role FROM group_members WHERE chat_id = $1 AND user_id = $2) END AS role,
+            CASE WHEN $5 THEN ARRAY(SELECT filter_name FROM filters WHERE chat_id = $1) END AS filter_names
+    """,
+    # All rows go out as parallel arrays, so the whole batch is one statement.
+    # The caller aggregates per (chat_id, user_id, hour), so no key appears twice
+    # in the hourly insert; the other tables regroup the batch first.
+    # Every data-modifying CTE runs even though nothing selects from it.
+    "log_activity_batch": """
+        WITH batch AS (
+            SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::int[], $4::timestamptz[], $5::timestamptz[])
+                AS b(chat_id, user_id, message_count, last_ts, bucket)
+        ),
+        lifetime AS (
+            INSERT INTO group_activity (chat_id, user_id, message_count, last_message_timestamp)
+            SELECT chat_id, user_id, SUM(message_count), MAX(last_ts) FROM batch GROUP BY chat_id, user_id
             ON CONFLICT (chat_id, user_id) DO UPDATE SET
-            message_count = group_activity.message_count + 1,
-            last_message_timestamp = NOW();
-            """,
-            chat_id, user_id
+            message_count = group_activity.message_count + EXCLUDED.message_count,
+            last_message_timestamp = GREATEST(group_activity.last_message_timestamp, EXCLUDED.last_message_timestamp)
+        ),
+        user_hourly AS (
+            INSERT INTO user_activity_hourly (chat_id, bucket, user_id, message_count)
+            SELECT chat_id, bucket, user_id, message_count FROM batch
+            ON CONFLICT (chat_id, bucket, user_id) DO UPDATE SET
+            message_count = user_activity_hourly.message_count + EXCLUDED.message_count
+        ),
+        user_daily AS (
+            INSERT INTO user_activity_daily (chat_id, bucket, user_id, message_count)
+            SELECT chat_id, date_trunc('day', bucket, 'UTC'), user_id, SUM(message_count) FROM batch
+            GROUP BY 1, 2, 3
+            ON CONFLICT (chat_id, bucket, user_id) DO UPDATE SET
+            message_count = user_activity_daily.message_count + EXCLUDED.message_count
+        ),
+        chat_hourly AS (
+            INSERT INTO chat_activity_hourly (chat_id, bucket, message_count)
+            SELECT chat_id, bucket, SUM(message_count) FROM batch GROUP BY 1, 2
+            ON CONFLICT (chat_id, bucket) DO UPDATE SET
+            message_count = chat_activity_hourly.message_count + EXCLUDED.message_count
+        ),
+        chat_daily AS (
+            INSERT INTO chat_activity_daily (chat_id, bucket, message_count)
+            SELECT chat_id, date_trunc('day', bucket, 'UTC'), SUM(message_count) FROM batch GROUP BY 1, 2
+            ON CONFLICT (chat_id, bucket) DO UPDATE SET
+            message_count = chat_activity_daily.message_count + EXCLUDED.message_count
         )
+        INSERT INTO chat_activity_totals (chat_id, message_count)
+        SELECT chat_id, SUM(message_count) FROM batch GROUP BY chat_id
+        ON CONFLICT (chat_id) DO UPDATE SET
+        message_count = chat_activity_totals.message_count + EXCLUDED.message_count;
+    """,
+    "prune_activity_rollups": """
+        WITH user_hourly AS (DELETE FROM user_activity_hourly WHERE bucket < $1),
+        chat_hourly AS (DELETE FROM chat_activity_hourly WHERE bucket < $1),
+        user_daily AS (DELETE FROM user_activity_daily WHERE bucket < $2)
+        DELETE FROM chat_activity_daily WHERE bucket < $2;
+    """,
+    "get_top_active_users": """
+        SELECT u.first_name, ga.message_count
+        FROM group_activity ga
+        JOIN users u ON ga.user_id = u.user_id
+        WHERE ga.chat_id = $1
+        ORDER BY ga.message_count DESC
+        LIMIT $2;
+    """,
+    "get_top_active_users_hourly": """
+        SELECT u.first_name, SUM(a.message_count) AS message_count
+        FROM user_activity_hourly a
+        JOIN users u ON a.user_id = u.user_id
+        WHERE a.chat_id = $1 AND a.bucket >= $2
+        GROUP BY u.user_id, u.first_name
+        ORDER BY message_count DESC
+        LIMIT $3;
+    """,
+    "get_top_active_users_daily": """
+        SELECT u.first_name, SUM(a.message_count) AS message_count
+        FROM user_activity_daily a
+        JOIN users u ON a.user_id = u.user_id
+        WHERE a.chat_id = $1 AND a.bucket >= $2
+        GROUP BY u.user_id, u.first_name
+        ORDER BY message_count DESC
+        LIMIT $3;
+    """,
+    "get_total_group_messages": "SELECT message_count FROM chat_activity_totals WHERE chat_id = $1",
+    "get_group_messages_hourly": "SELECT SUM(message_count) FROM chat_activity_hourly WHERE chat_id = $1 AND bucket >= $2",
+    "get_group_messages_daily": "SELECT SUM(message_count) FROM chat_activity_daily WHERE chat_id = $1 AND bucket >= $2",
+    "queue_add": """
+        INSERT INTO music_queue (chat_id, position, query, title, requester, video_id)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING entry_id;
+    """,
+    "queue_remove": "DELETE FROM music_queue WHERE entry_id = $1",
+    "queue_set_position": "UPDATE music_queue SET position = $2 WHERE entry_id = $1",
+    # Moves an entry out of the queue and into the chat's now-playing slot
+    "queue_start": """
+        WITH removed AS (DELETE FROM music_queue WHERE entry_id = $2)
+        INSERT INTO music_state (chat_id, now_playing) VALUES ($1, $3)
+        ON CONFLICT (chat_id) DO UPDATE SET
+        now_playing = EXCLUDED.now_playing,
+        updated_at = NOW();
+    """,
+    "queue_finish": "DELETE FROM music_state WHERE chat_id = $1",
+    "queue_clear": """
+        WITH state AS (DELETE FROM music_state WHERE chat_id = $1)
+        DELETE FROM music_queue WHERE chat_id = $1;
+    """,
+    "queue_load_entries": """
+        SELECT entry_id, chat_id, position, query, title, requester, video_id
+        FROM music_queue
+        ORDER BY chat_id, position;
+    """,
+    "queue_load_state": "SELECT chat_id, now_playing FROM music_state",
+}
+
+
+class QueryStats:
+    """Call count, errors, latency and pool wait time of one named statement."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.pool_wait = Histogram()
+
+
+class Database:
+    """Owns the connection pool and runs every statement in STATEMENTS, timing each one."""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.stats = {name: QueryStats() for name in STATEMENTS}
+
+    async def _run(self, method: str, name: str, *args):
+        stats = self.stats[name]
+        stats.calls += 1
+        requested = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            acquired = time.perf_counter()
+            stats.pool_wait.observe(acquired - requested)
+            try:
+                return await getattr(conn, method)(STATEMENTS[name], *args)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - acquired)
+
+    async def _execute(self, name: str, *args):
+        return await self._run("execute", name, *args)
+
+    async def _fetch(self, name: str, *args):
+        return await self._run("fetch", name, *args)
+
+    async def _fetchrow(self, name: str, *args):
+        return await self._run("fetchrow", name, *args)
+
+    async def _fetchval(self, name: str, *args):
+        return await self._run("fetchval", name, *args)
+
+    def stats_report(self) -> list:
+        """Returns per-statement stats, the statements taking the most total time first."""
+        report = [
+            {
+                "query": name,
+                "calls": s.calls,
+                "errors": s.errors,
+                "total_ms": s.latency.sum * 1000,
+                "p50_ms": s.latency.quantile(0.5) * 1000,
+                "p99_ms": s.latency.quantile(0.99) * 1000,
+                "pool_wait_ms": s.pool_wait.sum * 1000,
+            }
+            for name, s in self.stats.items() if s.calls
+        ]
+        return sorted(report, key=lambda r: r["total_ms"], reverse=True)
+
+    async def close(self):
+        await self.pool.close()
+
+    # --- Users and groups ---
 
-async def get_top_active_users(pool: asyncpg.Pool, chat_id: int, limit: int = 5):
-    """Gets the most active users in a group."""
-    async with pool.acquire() as conn:
-        return await conn.fetch(
-            """
-            SELECT u.first_name, ga.message_count
-            FROM group_activity ga
-            JOIN users u ON ga.user_id = u.user_id
-            WHERE ga.chat_id = $1
-            ORDER BY ga.message_count DESC
-            LIMIT $2;
-            """,
-            chat_id, limit
+    async def add_user_if_not_exists(self, user_id: int, first_name: str, username: Optional[str], is_bot: bool):
+        """Makes sure the user exists with their current name. Skips the database for users seen recently."""
+        fingerprint = hash((first_name, username))
+        if known_users.get(user_id) == fingerprint:
+            return
+        await self._execute("add_user", user_id, first_name, username, is_bot)
+        known_users.set(user_id, fingerprint)
+
+    async def add_group_if_not_exists(self, chat_id: int, title: str):
+        await self._execute("add_group", chat_id, title)
+
+    # --- Roles ---
+
+    async def set_member_role(self, user_id: int, chat_id: int, role: Role):
+        await self._execute("set_member_role", user_id, chat_id, role.name.lower())
+        member_roles.set((chat_id, user_id), role)
+
+    async def get_member_role(self, user_id: int, chat_id: int) -> Optional[Role]:
+        role = member_roles.get((chat_id, user_id), MISSING)
+        if role is not MISSING:
+            return role
+
+        role_str = await self._fetchval("get_member_role", user_id, chat_id)
+        role = Role[role_str.upper()] if role_str else None
+        member_roles.set((chat_id, user_id), role)
+        return role
+
+    async def remove_member_role(self, user_id: int, chat_id: int):
+        await self._execute("remove_member_role", user_id, chat_id)
+        member_roles.set((chat_id, user_id), None)
+
+    # --- Warnings ---
+
+    async def add_warning_and_get_count(self, user_id: int, chat_id: int, warner_id: int) -> int:
+        """Adds a warning and returns the new total warning count for the user in that chat."""
+        return await self._fetchval("add_warning", user_id, chat_id, warner_id)
+
+    # --- Chat config (locks, banned names) ---
+
+    async def get_chat_config(self, chat_id: int) -> dict:
+        """Returns the decoded config of a chat, from the cache when possible."""
+        config = chat_configs.get(chat_id)
+        if config is not None:
+            return config
+
+        # jsonb is decoded by the codec registered in init_connection
+        config = await self._fetchval("get_chat_config", chat_id) or {}
+        chat_configs.set(chat_id, config)
+        return config
+
+    async def set_group_lock(self, chat_id: int, lock_type: str, status: bool):
+        """Sets a specific lock type to true or false for a group."""
+        await self._execute("set_group_lock", lock_type, status, chat_id)
+        invalidate_chat_config(chat_id)
+
+    async def get_group_locks(self, chat_id: int) -> dict:
+        """Gets the lock configuration for a group."""
+        config = await self.get_chat_config(chat_id)
+        return config.get("locks") or {}
+
+    async def add_banned_name_pattern(self, chat_id: int, pattern: str):
+        """Adds a new banned name pattern for a group."""
+        await self._execute("add_banned_name", [pattern], chat_id)
+        invalidate_chat_config(chat_id)
+
+    async def remove_banned_name_pattern(self, chat_id: int, pattern: str):
+        """Removes a banned name pattern from a group."""
+        await self._execute("remove_banned_name", pattern, chat_id)
+        invalidate_chat_config(chat_id)
+
+    async def get_banned_name_patterns(self, chat_id: int) -> list:
+        """Gets the list of banned name patterns for a group."""
+        config = await self.get_chat_config(chat_id)
+        return config.get("banned_names") or []
+
+    # --- Filters ---
+
+    async def add_filter(self, chat_id: int, filter_name: str, reply_text: str, reply_type: str, file_id: str):
+        """Adds a new filter to the database."""
+        await self._execute("add_filter", chat_id, filter_name, reply_text, reply_type, file_id)
+        trigger_added(chat_id, filter_name)
+
+    async def remove_filter(self, chat_id: int, filter_name: str):
+        """Removes a filter from the database."""
+        await self._execute("remove_filter", chat_id, filter_name)
+        trigger_removed(chat_id, filter_name)
+
+    async def get_filter_names(self, chat_id: int) -> list:
+        """Gets the trigger names of all filters in a chat."""
+        rows = await self._fetch("get_filter_names", chat_id)
+        return [row["filter_name"] for row in rows]
+
+    async def get_filter(self, chat_id: int, filter_name: str):
+        """Gets the reply of a single filter."""
+        return await self._fetchrow("get_filter", chat_id, filter_name)
+
+    # --- Per-update context ---
+
+    async def load_chat_context(self, chat_id: int, user_id: Optional[int], need_config: bool, need_role: bool, need_filters: bool):
+        """Fetches whichever of config, sender role and filter names are requested, in one round trip."""
+        return await self._fetchrow("load_chat_context", chat_id, user_id, need_config, need_role, need_filters)
+
+    # --- Activity ---
+
+    async def log_user_activity_batch(self, rows: list):
+        """Adds a batch of (chat_id, user_id, message_count, last_message_timestamp, hour_bucket) rows
+        to the lifetime counts and to the hourly and daily rollups."""
+        await self._execute(
+            "log_activity_batch",
+            [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows], [r[4] for r in rows]
         )
 
-async def get_total_group_messages(pool: asyncpg.Pool, chat_id: int) -> int:
-    """Gets the total message count for a group."""
-    async with pool.acquire() as conn:
-        count = await conn.fetchval(
-            "SELECT SUM(message_count) FROM group_activity WHERE chat_id = $1",
-            chat_id
+    async def prune_activity_rollups(self):
+        """Deletes rollup buckets that no period reaches back to anymore."""
+        now = datetime.now(timezone.utc)
+        await self._execute("prune_activity_rollups", now - HOURLY_RETENTION, now - DAILY_RETENTION)
+
+    async def get_top_active_users(self, chat_id: int, limit: int = 5, period: Optional[str] = None):
+        """Gets the most active users in a group, over its lifetime or over one of ACTIVITY_PERIODS."""
+        if period is None:
+            return await self._fetch("get_top_active_users", chat_id, limit)
+        granularity, since = _period_start(period)
+        return await self._fetch(f"get_top_active_users_{granularity}", chat_id, since, limit)
+
+    async def get_total_group_messages(self, chat_id: int, period: Optional[str] = None) -> int:
+        """Gets the total message count for a group, over its lifetime or over one of ACTIVITY_PERIODS."""
+        if period is None:
+            count = await self._fetchval("get_total_group_messages", chat_id)
+        else:
+            granularity, since = _period_start(period)
+            count = await self._fetchval(f"get_group_messages_{granularity}", chat_id, since)
+        return count or 0
+
+    # --- Music queue ---
+
+    async def queue_add(self, chat_id: int, position: float, query: str, title: str, requester: str, video_id: Optional[str]) -> int:
+        """Stores a queued entry and returns its id."""
+        return await self._fetchval("queue_add", chat_id, position, query, title, requester, video_id)
+
+    async def queue_remove(self, entry_id: int):
+        await self._execute("queue_remove", entry_id)
+
+    async def queue_set_position(self, entry_id: int, position: float):
+        await self._execute("queue_set_position", entry_id, position)
+
+    async def queue_start(self, chat_id: int, entry_id: int, now_playing: dict):
+        """Removes an entry from the stored queue and records it as the chat's current track."""
+        await self._execute("queue_start", chat_id, entry_id, now_playing)
+
+    async def queue_finish(self, chat_id: int):
+        await self._execute("queue_finish", chat_id)
+
+    async def queue_clear(self, chat_id: int):
+        await self._execute("queue_clear", chat_id)
+
+    async def queue_load(self) -> tuple:
+        """Returns every stored queue entry (ordered by chat and position) and every now-playing row."""
+        return await self._fetch("queue_load_entries"), await self._fetch("queue_load_state")
+
+
+def log_query_stats(db: Database, limit: int = 10):
+    """Logs the statements that took the most total time."""
+    for row in db.stats_report()[:limit]:
+        logger.info(
+            f"[query] {row['query']}: {row['calls']} calls, {row['errors']} errors, "
+            f"{row['total_ms']:.1f}ms total, p50 {row['p50_ms']:.2f}ms, p99 {row['p99_ms']:.2f}ms, "
+            f"pool wait {row['pool_wait_ms']:.1f}ms"
         )
-        return count or 0
\ No newline at end of file
@@ -1,28 +1,32 @@
 # bot/core/decorators.py
 from functools import wraps
 from pyrogram.types import Message
-from bot.core.database import get_member_role, Role
+from bot.core.context import get_chat_context
+from bot.core.database import Role
+from bot.core.raid import raid_monitor
 
 def require_role(required_role: Role):
     def decorator(func):
         @wraps(func)
         async def wrapper(client: "Bot", message: Message, *args, **kwargs):
             user_id = message.from_user.id
-            chat_id = message.chat.id
 
             # The bot owner (from .env file) bypasses all permission checks
             if user_id == client.owner_id:
                 return await func(client, message, *args, **kwargs)
 
-            # Get the user's role from the database for this specific group
-            user_role = await get_member_role(client.db, user_id, chat_id)
+            # The user's role in this group, usually already loaded for this update
+            context = await get_chat_context(client, message)
 
             # Check if the user has a role and if its value is high enough
-            if user_role and user_role.value >= required_role.value:
+            if context.has_role(required_role):
                 return await func(client, message, *args, **kwargs)
-            else:
-                await message.reply_text(
-                    "❌ You don't have enough permissions to use this command."
+            elif not raid_monitor.active(message.chat.id):
+                # Someone spamming a command they can't use gets one answer per queued reply
+                await client.outbound.reply(
+                    message,
+                    "❌ You don't have enough permissions to use this command.",
+                    key=("no_permission", message.chat.id, user_id),
                 )
                 return None
         return wrapper
@@ -0,0 +1,65 @@
+# bot/core/deletions.py
+import asyncio
+
+from loguru import logger
+
+from bot.core.outbound import Priority
+
+# Telegram deletes at most this many messages per delete_messages call
+MAX_BATCH = 100
+
+
+class DeletionBatcher:
+    """Collects message deletions per chat and sends them as batched delete_messages calls.
+
+    The first deletion in a chat opens a window of `window` seconds; every
+    deletion in that chat until it closes goes out in the same call, or
+    sooner once MAX_BATCH are collected.
+    """
+
+    def __init__(self, client: "Bot", window: float = 0.5):
+        self.client = client
+        self.window = window
+        # chat_id -> message ids waiting to be deleted
+        self._pending: dict = {}
+        self._timers: dict = {}
+        self.batches = 0
+        self.deleted = 0
+
+    def delete(self, message):
+        chat_id = message.chat.id
+        ids = self._pending.setdefault(chat_id, [])
+        ids.append(message.id)
+        if len(ids) >= MAX_BATCH:
+            self._flush(chat_id)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(self.window, self._flush, chat_id)
+
+    def _flush(self, chat_id: int):
+        timer = self._timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        ids = self._pending.pop(chat_id, None)
+        if not ids:
+            return
+        self.batches += 1
+        self.deleted += len(ids)
+        future = self.client.outbound.submit(chat_id, Priority.MODERATION, self.client.delete_messages, chat_id, ids)
+        future.add_done_callback(lambda f: self._log_failure(chat_id, len(ids), f))
+
+    @staticmethod
+    def _log_failure(chat_id: int, count: int, future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            logger.warning(f"Could not delete {count} messages in {chat_id}: {future.exception()}")
+
+    def flush_all(self):
+        """Sends every pending batch now, e.g. before shutting down."""
+        for chat_id in list(self._pending):
+            self._flush(chat_id)
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(map(len, self._pending.values())),
+            "batches": self.batches,
+            "deleted": self.deleted,
+        }
@@ -0,0 +1,224 @@
+# bot/core/dispatcher.py
+import asyncio
+import inspect
+import time
+from collections import OrderedDict, deque
+
+import pyrogram
+from loguru import logger
+from pyrogram.dispatcher import Dispatcher
+from pyrogram.handlers import RawUpdateHandler
+
+from bot.core.load import Criticality, load_monitor
+from bot.core.metrics import Histogram, registry
+
+
+# Seconds between warnings about the same lane's backlog
+BACKLOG_WARNING_INTERVAL = 10.0
+
+
+def chat_key(update) -> int:
+    """The chat a raw update belongs to, for sharding. 0 for updates without one."""
+    message = getattr(update, "message", None)
+    peer = getattr(message, "peer_id", None) or getattr(update, "peer", None)
+    if peer is not None:
+        return getattr(peer, "channel_id", None) or getattr(peer, "chat_id", None) or getattr(peer, "user_id", 0)
+    return getattr(update, "channel_id", None) or getattr(update, "chat_id", None) or getattr(update, "user_id", 0)
+
+
+class _Lane:
+    """Updates for the chats sharded onto one lane, with one queue per chat."""
+
+    def __init__(self, index: int, warn_backlog: int):
+        self.index = index
+        self.warn_backlog = warn_backlog
+        self.warned_at = 0.0
+        # chat key -> deque of (queued at, packet); key order is the round-robin order
+        self.chats: OrderedDict = OrderedDict()
+        # Chats with an update being handled right now; their next one waits
+        self.busy: set = set()
+        self.wakeup = asyncio.Event()
+        self.backlog = 0
+        self.peak_backlog = 0
+        self.handled = 0
+
+    def put(self, key: int, packet):
+        self.chats.setdefault(key, deque()).append((time.monotonic(), packet))
+        self.backlog += 1
+        self.peak_backlog = max(self.peak_backlog, self.backlog)
+        self.wakeup.set()
+        if self.backlog >= self.warn_backlog and time.monotonic() - self.warned_at > BACKLOG_WARNING_INTERVAL:
+            self.warned_at = time.monotonic()
+            logger.warning(f"Update lane {self.index} has {self.backlog} updates waiting across {len(self.chats)} chats")
+
+    def take(self):
+        """Returns (key, packet) of the next chat that has nothing running, or None."""
+        for key, packets in self.chats.items():
+            if key in self.busy:
+                continue
+            _, packet = packets.popleft()
+            if packets:
+                self.chats.move_to_end(key)
+            else:
+                del self.chats[key]
+            self.busy.add(key)
+            self.backlog -= 1
+            return key, packet
+        return None
+
+    def oldest(self) -> float:
+        """When the longest-waiting update in this lane was queued, or None if none is."""
+        return min((packets[0][0] for packets in self.chats.values()), default=None)
+
+
+class LaneDispatcher(Dispatcher):
+    """Dispatches updates on per-chat lanes instead of a shared worker pool.
+
+    Each chat is hashed onto one of `lanes` lanes. A lane runs up to
+    `concurrency` updates at once, but never two from the same chat, so
+    a chat's updates are handled strictly in order while a slow handler
+    in one chat doesn't hold up others. Lanes never refuse updates, since
+    holding them back would stall every other lane too; a lane with more
+    than `warn_backlog` waiting is logged instead.
+    """
+
+    def __init__(self, client: "pyrogram.Client", lanes: int = 8, concurrency: int = 4, warn_backlog: int = 1000):
+        super().__init__(client)
+        self.lane_count = lanes
+        self.concurrency = concurrency
+        self.warn_backlog = warn_backlog
+        self.lanes: list = []
+        # handler callback -> Histogram of its run time, filled only while metrics are enabled
+        self.handler_time: dict = {}
+        self._router: asyncio.Task = None
+
+    async def start(self):
+        if self.client.no_updates:
+            return
+        self.lanes = [_Lane(index, self.warn_backlog) for index in range(self.lane_count)]
+        for lane in self.lanes:
+            for _ in range(self.concurrency):
+                # add_handler() takes every lock in locks_list before changing handler groups
+                lock = asyncio.Lock()
+                self.locks_list.append(lock)
+                self.handler_worker_tasks.append(self.loop.create_task(self._lane_worker(lane, lock)))
+        self._router = self.loop.create_task(self._route())
+        logger.info(f"Started {self.lane_count} update lanes with {self.concurrency} workers each")
+
+    async def stop(self):
+        if self.client.no_updates:
+            return
+        if self._router:
+            self._router.cancel()
+            await asyncio.gather(self._router, return_exceptions=True)
+            self._router = None
+        for task in self.handler_worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.handler_worker_tasks, return_exceptions=True)
+        self.handler_worker_tasks.clear()
+        self.locks_list.clear()
+        self.groups.clear()
+        logger.info(f"Stopped update lanes: {self.stats()}")
+
+    async def _route(self):
+        while True:
+            packet = await self.updates_queue.get()
+            if packet is None:
+                continue
+            key = chat_key(packet[0])
+            self.lanes[hash(key) % self.lane_count].put(key, packet)
+
+    async def _lane_worker(self, lane: _Lane, lock: asyncio.Lock):
+        while True:
+            job = lane.take()
+            if job is None:
+                lane.wakeup.clear()
+                await lane.wakeup.wait()
+                continue
+
+            key, packet = job
+            try:
+                await self._handle(packet, lock)
+            finally:
+                lane.busy.discard(key)
+                lane.handled += 1
+                # The chat's next update, if any, may run now
+                lane.wakeup.set()
+
+    async def _handle(self, packet, lock: asyncio.Lock):
+        # The same steps as Dispatcher.handler_worker() for one update
+        try:
+            update, users, chats = packet
+            parser = self.update_parsers.get(type(update), None)
+            parsed_update, handler_type = (
+                await parser(update, users, chats)
+                if parser is not None
+                else (None, type(None))
+            )
+
+            async with lock:
+                for group in self.groups.values():
+                    for handler in group:
+                        args = None
+
+                        if isinstance(handler, handler_type):
+                            try:
+                                if await handler.check(self.client, parsed_update):
+                                    args = (parsed_update,)
+                            except Exception as e:
+                                logger.exception(e)
+                                continue
+
+                        elif isinstance(handler, RawUpdateHandler):
+                            args = (update, users, chats)
+
+                        if args is None:
+                            continue
+
+                        # Under load, less important handlers are skipped as if they had run
+                        if not load_monitor.admits(getattr(handler.callback, "criticality", Criticality.NORMAL)):
+                            break
+
+                        started = time.perf_counter() if registry.enabled else None
+                        try:
+                            if inspect.iscoroutinefunction(handler.callback):
+                                await handler.callback(self.client, *args)
+                            else:
+                                await self.loop.run_in_executor(
+                                    self.client.executor, handler.callback, self.client, *args
+                                )
+                        except pyrogram.StopPropagation:
+                            raise
+                        except pyrogram.ContinuePropagation:
+                            continue
+                        except Exception as e:
+                            logger.exception(e)
+                        finally:
+                            if started is not None:
+                                self._observe(handler.callback, time.perf_counter() - started)
+
+                        break
+        except pyrogram.StopPropagation:
+            pass
+        except Exception as e:
+            logger.exception(e)
+
+    def _observe(self, callback, seconds: float):
+        histogram = self.handler_time.get(callback)
+        if histogram is None:
+            histogram = self.handler_time[callback] = Histogram()
+        histogram.observe(seconds)
+
+    def pressure(self) -> tuple:
+        """(updates waiting, seconds the oldest of them has waited), for the load monitor."""
+        backlog = self.updates_queue.qsize() + sum(lane.backlog for lane in self.lanes)
+        oldest = min(filter(None, (lane.oldest() for lane in self.lanes)), default=None)
+        return backlog, time.monotonic() - oldest if oldest is not None else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "backlog": [lane.backlog for lane in self.lanes],
+            "running": [len(lane.busy) for lane in self.lanes],
+            "peak_backlog": max((lane.peak_backlog for lane in self.lanes), default=0),
+            "handled": sum(lane.handled for lane in self.lanes),
+        }
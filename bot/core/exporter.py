@@ -0,0 +1,195 @@
+# bot/core/exporter.py
+import asyncio
+
+from loguru import logger
+
+from bot.core.chat_config import chat_configs
+from bot.core.database import known_users, member_roles
+from bot.core.dispatcher import LaneDispatcher
+from bot.core.filter_index import filter_indexes
+from bot.core.load import load_monitor
+from bot.core.metrics import Registry, histogram_samples
+from bot.core.music_helpers import download_time, extraction_pool, media_cache, music_queues, prepare_time
+from bot.core.name_matcher import name_matchers
+from bot.core.outbound import Priority
+from bot.core.raid import raid_monitor
+
+# Requests larger than this are not metrics scrapes
+MAX_REQUEST_BYTES = 8192
+
+
+class MetricsServer:
+    """Serves the registry at GET /metrics in the Prometheus text format.
+
+    A minimal HTTP/1.0 responder on asyncio streams; every other path gets a
+    404. Meant to be bound to localhost and scraped by a local agent.
+    """
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.scrapes = 0
+        self._server: asyncio.AbstractServer = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            method, path, *_ = head[:MAX_REQUEST_BYTES].decode("latin-1").split(" ", 2)
+            if method == "GET" and path.split("?")[0] == "/metrics":
+                self.scrapes += 1
+                status, body = "200 OK", self.registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", b"Not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception as e:
+            logger.warning(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+
+# --- Bot collector ---
+
+def _counter(name: str, help_text: str, value) -> tuple:
+    return name, "counter", help_text, [("", {}, value)]
+
+
+def _gauge(name: str, help_text: str, samples: list) -> tuple:
+    return name, "gauge", help_text, samples
+
+
+# The LRU caches whose hit rates are exported
+CACHES = {
+    "known_users": known_users,
+    "member_roles": member_roles,
+    "chat_configs": chat_configs,
+    "filter_indexes": filter_indexes,
+    "name_matchers": name_matchers,
+    "media_queries": media_cache.queries,
+}
+
+
+def collector(client: "Bot"):
+    """Returns a collector reading the bot's own counters; it does all its work at scrape time."""
+
+    def collect() -> list:
+        families = []
+
+        # Updates and handlers
+        dispatcher = client.dispatcher
+        if isinstance(dispatcher, LaneDispatcher):
+            families.append(_counter(
+                "bot_updates_handled_total", "Updates handled by the lane dispatcher.",
+                sum(lane.handled for lane in dispatcher.lanes),
+            ))
+            families.append(_gauge("bot_update_backlog", "Updates waiting per lane.", [
+                ("", {"lane": lane.index}, lane.backlog) for lane in dispatcher.lanes
+            ]))
+            families.append(("bot_handler_seconds", "histogram", "Time spent in each update handler.", [
+                sample
+                for callback, histogram in list(dispatcher.handler_time.items())
+                for sample in histogram_samples(
+                    histogram, {"handler": f"{callback.__module__}.{callback.__qualname__}"}
+                )
+            ]))
+        families.append(_gauge("bot_load_level", "Current load level; 0 normal, 1 degraded, 2 overloaded.", [
+            ("", {}, int(load_monitor.level)),
+        ]))
+        families.append(("bot_handlers_shed_total", "counter", "Handler runs skipped under load.", [
+            ("", {"criticality": level}, count) for level, count in load_monitor.shed.items()
+        ]))
+
+        # Database
+        if client.db:
+            pool = client.db.pool
+            families.append(_gauge("bot_db_pool_connections", "Connections in the database pool.", [
+                ("", {"state": "open"}, pool.get_size()),
+                ("", {"state": "idle"}, pool.get_idle_size()),
+                ("", {"state": "max"}, pool.get_max_size()),
+            ]))
+            stats = [(name, s) for name, s in client.db.stats.items() if s.calls]
+            families.append(("bot_db_queries_total", "counter", "Calls per named statement.", [
+                ("", {"query": name}, s.calls) for name, s in stats
+            ]))
+            families.append(("bot_db_query_errors_total", "counter", "Failed calls per named statement.", [
+                ("", {"query": name}, s.errors) for name, s in stats
+            ]))
+            families.append(("bot_db_query_seconds", "histogram", "Statement run time once connected.", [
+                sample for name, s in stats for sample in histogram_samples(s.latency, {"query": name})
+            ]))
+            families.append(("bot_db_pool_wait_seconds", "histogram", "Time waiting for a pool connection.", [
+                sample for name, s in stats for sample in histogram_samples(s.pool_wait, {"query": name})
+            ]))
+
+        # Caches
+        families.append(("bot_cache_lookups_total", "counter", "Cache lookups by result.", [
+            sample
+            for name, cache in CACHES.items()
+            for sample in (("", {"cache": name, "result": "hit"}, cache.hits),
+                           ("", {"cache": name, "result": "miss"}, cache.misses))
+        ]))
+        families.append(_gauge("bot_cache_entries", "Entries held per cache.", [
+            ("", {"cache": name}, len(cache)) for name, cache in CACHES.items()
+        ]))
+
+        # Outbound API calls
+        outbound = client.outbound
+        families.append(("bot_outbound_calls_total", "counter", "Outbound API calls by outcome.", [
+            ("", {"outcome": "sent"}, outbound.sent),
+            ("", {"outcome": "failed"}, outbound.failed),
+            ("", {"outcome": "coalesced"}, outbound.coalesced),
+            ("", {"outcome": "dropped"}, outbound.dropped),
+        ]))
+        families.append(_counter("bot_outbound_flood_waits_total", "FloodWait errors received.", outbound.flood_waits))
+        families.append(_gauge("bot_outbound_queue_depth", "Outbound calls waiting to be sent.", [
+            ("", {}, outbound.queue_depth),
+        ]))
+        families.append(("bot_outbound_wait_seconds", "histogram", "Time outbound calls waited before sending.", [
+            sample
+            for priority in Priority
+            for sample in histogram_samples(outbound.wait_time[priority], {"priority": priority.name.lower()})
+        ]))
+
+        # Music
+        families.append(_gauge("bot_music_queued_songs", "Songs waiting across all chat queues.", [
+            ("", {}, music_queues.queued_count),
+        ]))
+        families.append(("bot_media_cache_lookups_total", "counter", "Track lookups in the media cache.", [
+            ("", {"result": "hit"}, media_cache.hits),
+            ("", {"result": "miss"}, media_cache.misses),
+        ]))
+        families.append(_gauge("bot_media_cache_bytes", "Bytes of downloaded media kept on disk.", [
+            ("", {}, media_cache.total_bytes),
+        ]))
+        families.append(("bot_extraction_seconds", "histogram", "yt-dlp jobs by phase.", [
+            *histogram_samples(extraction_pool.wait_time, {"phase": "wait"}),
+            *histogram_samples(extraction_pool.run_time, {"phase": "run"}),
+        ]))
+        families.append(("bot_track_download_seconds", "histogram", "Downloads of tracks that were not cached.",
+                         histogram_samples(download_time)))
+        families.append(("bot_track_prepare_seconds", "histogram", "Time for a queued song to become playable.",
+                         histogram_samples(prepare_time)))
+
+        # Moderation
+        families.append(_counter("bot_raids_total", "Times a chat went into raid mode.", raid_monitor.raids))
+        families.append(_counter("bot_messages_deleted_total", "Messages deleted by the bot.", client.deletions.deleted))
+        return families
+
+    return collect
@@ -0,0 +1,166 @@
+# bot/core/extraction.py
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
+
+from bot.core.metrics import Histogram
+
+
+class ExtractionQueueFull(Exception):
+    """Raised by ExtractionPool.submit() when the job queue is at capacity."""
+
+
+class _Job:
+    __slots__ = ("chat_id", "fn", "args", "future", "queued_at")
+
+    def __init__(self, chat_id: int, fn, args: tuple, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class ExtractionPool:
+    """Runs blocking yt-dlp work in its own worker processes.
+
+    Jobs wait in a bounded queue with one lane per chat, and the lanes are
+    served round-robin, so one chat queuing a long playlist can't starve
+    the others. Keeping extraction out of the bot's process keeps its CPU
+    use (and the GIL) away from the event loop running moderation handlers.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 100):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: ProcessPoolExecutor = None
+        # chat_id -> deque of jobs; order of keys is the round-robin order
+        self._lanes: OrderedDict = OrderedDict()
+        self._queued = 0
+        self._wakeup: asyncio.Event = None
+        self._runners = []
+        self.wait_time = Histogram()
+        self.run_time = Histogram()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def start(self):
+        # spawn: the parent runs threads, which fork doesn't mix well with
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._wakeup = asyncio.Event()
+        self._runners = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} extraction workers")
+
+    async def stop(self):
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+        for lane in self._lanes.values():
+            for job in lane:
+                if not job.future.done():
+                    job.future.cancel()
+        self._lanes.clear()
+        self._queued = 0
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, chat_id: int, fn, *args):
+        """Queues fn(*args) to run in a worker process on behalf of a chat and returns its result.
+
+        `fn` and its arguments must be picklable. If the caller is cancelled
+        before the job starts, the job is dropped from the queue.
+        """
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise ExtractionQueueFull("Too many tracks are being fetched right now, try again shortly.")
+
+        job = _Job(chat_id, fn, args, asyncio.get_running_loop().create_future())
+        self._lanes.setdefault(chat_id, deque()).append(job)
+        self._queued += 1
+        self._wakeup.set()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._drop(job)
+            raise
+
+    def _drop(self, job: _Job):
+        lane = self._lanes.get(job.chat_id)
+        if lane and job in lane:
+            lane.remove(job)
+            self._queued -= 1
+            self.cancelled += 1
+            if not lane:
+                del self._lanes[job.chat_id]
+
+    def _next_job(self):
+        """Takes the next job from the lane at the head of the round-robin order."""
+        while self._lanes:
+            chat_id, lane = next(iter(self._lanes.items()))
+            job = lane.popleft()
+            self._queued -= 1
+            if lane:
+                self._lanes.move_to_end(chat_id)
+            else:
+                del self._lanes[chat_id]
+            if not job.future.done():
+                return job
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            started = time.perf_counter()
+            self.wait_time.observe(started - job.queued_at)
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn, *job.args)
+            except asyncio.CancelledError:
+                # Shutting down: don't leave the caller waiting forever
+                job.future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed += 1
+                # The caller may have given up while the job was running
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.run_time.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queued,
+            "waiting_chats": len(self._lanes),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "wait_p50_ms": self.wait_time.quantile(0.5) * 1000,
+            "wait_p99_ms": self.wait_time.quantile(0.99) * 1000,
+            "run_p50_ms": self.run_time.quantile(0.5) * 1000,
+            "run_p99_ms": self.run_time.quantile(0.99) * 1000,
+        }
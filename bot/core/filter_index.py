@@ -0,0 +1,126 @@
+# bot/core/filter_index.py
+from collections import deque
+from typing import Optional
+
+from bot.core.cache import LRUCache
+
+
+def normalize(text: str) -> str:
+    """Lowercases and collapses whitespace, so triggers and messages compare the same way."""
+    return " ".join(text.lower().split())
+
+
+class TriggerIndex:
+    """Aho-Corasick automaton over a chat's filter triggers.
+
+    Finding a trigger costs one pass over the message, no matter how many
+    triggers the chat has. Matches only count on word boundaries, like the
+    old `f" {name} " in f" {text} "` check.
+    """
+
+    def __init__(self, triggers=()):
+        # normalized trigger -> filter name as stored in the database
+        self._triggers = {}
+        # Trie as parallel lists indexed by node: children, trigger ending exactly here,
+        # failure link, and every trigger ending here (own plus those reached via failure links)
+        self._goto = [{}]
+        self._term = [None]
+        self._fail = [0]
+        self._out = [[]]
+        self._linked = True
+        for trigger in triggers:
+            self.add(trigger)
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def add(self, trigger: str):
+        """Adds a trigger to the trie. Failure links are recomputed on the next match."""
+        name, trigger = trigger, normalize(trigger)
+        if not trigger or trigger in self._triggers:
+            return
+        self._triggers[trigger] = name
+
+        node = 0
+        for char in trigger:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._term.append(None)
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][char] = nxt
+            node = nxt
+        self._term[node] = trigger
+        self._linked = False
+
+    def remove(self, trigger: str):
+        """Removes a trigger. The trie is rebuilt from the remaining triggers."""
+        trigger = normalize(trigger)
+        if trigger not in self._triggers:
+            return
+        remaining = [name for t, name in self._triggers.items() if t != trigger]
+        self.__init__(remaining)
+
+    def _link(self):
+        # Breadth-first pass setting each node's failure link to its longest proper
+        # suffix that is also in the trie, and collecting the triggers ending there
+        self._fail = [0] * len(self._goto)
+        self._out = [[]] * len(self._goto)
+
+        queue = deque()
+        for child in self._goto[0].values():
+            self._out[child] = [self._term[child]] if self._term[child] else []
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                own = [self._term[child]] if self._term[child] else []
+                self._out[child] = own + self._out[self._fail[child]]
+                queue.append(child)
+        self._linked = True
+
+    def find(self, text: str) -> Optional[str]:
+        """Returns the name of the first trigger that appears in the text as whole words, or None."""
+        if not self._triggers:
+            return None
+        if not self._linked:
+            self._link()
+
+        text = normalize(text)
+        last = len(text) - 1
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for trigger in out[node]:
+                start = i - len(trigger) + 1
+                if (start == 0 or text[start - 1] == " ") and (i == last or text[i + 1] == " "):
+                    return self._triggers[trigger]
+        return None
+
+
+# chat_id -> TriggerIndex
+filter_indexes = LRUCache(maxsize=5000, ttl=600)
+
+
+def trigger_added(chat_id: int, trigger: str):
+    """Updates a cached index in place after a filter was saved."""
+    index = filter_indexes.get(chat_id)
+    if index is not None:
+        index.add(trigger)
+
+
+def trigger_removed(chat_id: int, trigger: str):
+    """Updates a cached index in place after a filter was deleted."""
+    index = filter_indexes.get(chat_id)
+    if index is not None:
+        index.remove(trigger)
@@ -0,0 +1,135 @@
+# bot/core/load.py
+import asyncio
+import time
+from enum import IntEnum
+from typing import Callable
+
+from loguru import logger
+
+
+class Criticality(IntEnum):
+    """How much a handler matters when the bot falls behind; lower matters more."""
+    CRITICAL = 0     # moderation: lock enforcement, anti-bot, punishments
+    NORMAL = 1       # commands
+    BEST_EFFORT = 2  # activity counting, filter replies
+
+
+class LoadLevel(IntEnum):
+    NORMAL = 0      # everything runs
+    DEGRADED = 1    # best-effort handlers are skipped
+    OVERLOADED = 2  # only critical handlers run
+
+
+def criticality(level: Criticality):
+    """Tags a handler with its criticality. Untagged handlers are NORMAL.
+
+    Put it below @Client.on_message (and any other decorators), so the
+    function pyrogram registers carries the tag.
+    """
+    def decorator(func):
+        func.criticality = level
+        return func
+    return decorator
+
+
+class LoadMonitor:
+    """Watches the update backlog and switches between load levels.
+
+    Every `interval` seconds it reads (waiting updates, age of the oldest
+    one) from a probe. It steps up as soon as either crosses a level's
+    threshold, and steps down one level only after both have stayed below
+    half of that level's thresholds for `recover_after` seconds, so it
+    doesn't flap at the boundary.
+    """
+
+    def __init__(self, degrade_backlog: int = 200, overload_backlog: int = 1000,
+                 degrade_lag: float = 2.0, overload_lag: float = 10.0,
+                 recover_after: float = 10.0, interval: float = 1.0):
+        self.degrade_backlog = degrade_backlog
+        self.overload_backlog = overload_backlog
+        self.degrade_lag = degrade_lag
+        self.overload_lag = overload_lag
+        self.recover_after = recover_after
+        self.interval = interval
+        self.level = LoadLevel.NORMAL
+        self._probe: Callable[[], tuple] = None
+        self._task: asyncio.Task = None
+        self._calm_since: float = None
+        self.backlog = 0
+        self.lag = 0.0
+        self.transitions = {level.name.lower(): 0 for level in LoadLevel}
+        self.shed = {level.name.lower(): 0 for level in Criticality}
+
+    def admits(self, level: Criticality) -> bool:
+        """Whether a handler of this criticality should run at the current load; counts it if not."""
+        if level == Criticality.CRITICAL or level + self.level <= Criticality.BEST_EFFORT:
+            return True
+        self.shed[level.name.lower()] += 1
+        return False
+
+    def _thresholds(self, level: LoadLevel) -> tuple:
+        if level == LoadLevel.OVERLOADED:
+            return self.overload_backlog, self.overload_lag
+        return self.degrade_backlog, self.degrade_lag
+
+    def update(self, backlog: int, lag: float):
+        self.backlog, self.lag = backlog, lag
+        target = LoadLevel.NORMAL
+        for level in (LoadLevel.OVERLOADED, LoadLevel.DEGRADED):
+            max_backlog, max_lag = self._thresholds(level)
+            if backlog >= max_backlog or lag >= max_lag:
+                target = level
+                break
+
+        if target > self.level:
+            self._set_level(target)
+            return
+
+        max_backlog, max_lag = self._thresholds(self.level)
+        if self.level == LoadLevel.NORMAL or backlog > max_backlog / 2 or lag > max_lag / 2:
+            self._calm_since = None
+            return
+        now = time.monotonic()
+        if self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.recover_after:
+            self._set_level(LoadLevel(self.level - 1))
+
+    def _set_level(self, level: LoadLevel):
+        logger.warning(
+            f"Load level {self.level.name} -> {level.name} "
+            f"(backlog {self.backlog}, oldest update {self.lag:.1f}s old)"
+        )
+        self.level = level
+        self._calm_since = None
+        self.transitions[level.name.lower()] += 1
+
+    def start(self, probe: Callable[[], tuple]):
+        self._probe = probe
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.update(*self._probe())
+            except Exception as e:
+                logger.error(f"Load probe failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "level": self.level.name.lower(),
+            "backlog": self.backlog,
+            "lag": self.lag,
+            "transitions": dict(self.transitions),
+            "shed": dict(self.shed),
+        }
+
+
+load_monitor = LoadMonitor()
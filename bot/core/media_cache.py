@@ -0,0 +1,156 @@
+# bot/core/media_cache.py
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from bot.core.cache import LRUCache
+
+
+class MediaCache:
+    """Downloaded tracks on disk, keyed by video id.
+
+    Keeps total size under `max_bytes` by evicting the least recently used
+    files, remembers which video a search query resolved to for `query_ttl`
+    seconds, and merges concurrent requests for the same query or video
+    into a single resolution or download.
+
+    The index is a JSON file next to the media, so the cache survives restarts.
+    Entries are either the downloaded file ("source") or, with `transcode`,
+    raw PCM ("pcm") that plays without a live ffmpeg decode. Raw PCM takes
+    about 5.8 MB per minute, so size `max_bytes` accordingly.
+    """
+
+    def __init__(self, directory: str = "downloads", max_bytes: int = 2 * 1024 ** 3, query_ttl: float = 6 * 3600,
+                 transcode: bool = False):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.transcode = transcode
+        # normalized query -> {"id": ..., "title": ...}
+        self.queries = LRUCache(maxsize=5000, ttl=query_ttl)
+        # video_id -> {"path": ..., "title": ..., "format": ..., "size": ..., "last_access": ...}
+        self._index: dict = {}
+        # video_id -> number of queue entries still needing the file, so it isn't evicted under them
+        self._pins: dict = {}
+        self._inflight: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / "index.json"
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._index.values())
+
+    def load(self):
+        """Reads the on-disk index, dropping entries whose files are gone."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            index = json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable media index: {e}")
+            index = {}
+        self._index = {vid: entry for vid, entry in index.items() if os.path.exists(entry["path"])}
+        self._evict()
+        logger.info(f"Media cache: {len(self._index)} files, {self.total_bytes / 1024 ** 2:.1f} MB")
+
+    def _save(self):
+        # Write then rename, so a crash never leaves a half-written index
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._index))
+        os.replace(tmp, self.index_path)
+
+    def _evict(self):
+        total = self.total_bytes
+        if total <= self.max_bytes:
+            return
+        for vid, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if self._pins.get(vid):
+                continue
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+            del self._index[vid]
+            logger.info(f"Evicted {entry['title']} from the media cache")
+        self._save()
+
+    def pin(self, video_id: str):
+        self._pins[video_id] = self._pins.get(video_id, 0) + 1
+
+    def unpin(self, video_id: str):
+        count = self._pins.get(video_id, 0) - 1
+        if count > 0:
+            self._pins[video_id] = count
+        else:
+            self._pins.pop(video_id, None)
+
+    def get(self, video_id: str):
+        """Returns the cached entry for a video and marks it as recently used, or None."""
+        entry = self._index.get(video_id)
+        if entry is None or not os.path.exists(entry["path"]):
+            self._index.pop(video_id, None)
+            return None
+        entry["last_access"] = time.time()
+        return entry
+
+    def put(self, video_id: str, path: str, title: str, format: str = "source") -> dict:
+        entry = {
+            "path": path, "title": title, "format": format,
+            "size": os.path.getsize(path), "last_access": time.time(),
+        }
+        self._index[video_id] = entry
+        # Never evict the file that was just added
+        self.pin(video_id)
+        try:
+            self._evict()
+        finally:
+            self.unpin(video_id)
+        self._save()
+        return entry
+
+    async def single_flight(self, key, factory: Callable[[], Awaitable]):
+        """Runs factory() once per key at a time; concurrent callers share the result.
+
+        The shared task is shielded from any single caller being cancelled,
+        and only cancelled once every caller waiting on it has given up.
+        """
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory())
+            # [task, number of callers waiting on it]
+            flight = [task, 0]
+            self._inflight[key] = flight
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if flight[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries.stats(),
+        }
@@ -0,0 +1,98 @@
+# bot/core/metrics.py
+import bisect
+
+# Upper bounds in seconds, roughly log-spaced from half a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# For things measured in seconds to minutes, like downloads
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    """Counts observations into fixed buckets and keeps their count and sum."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # One slot per bucket plus one for everything above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls into."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+# --- Exposition ---
+# A family is (name, type, help, samples), and each sample is (name suffix, labels, value),
+# rendered in the Prometheus text format.
+
+def histogram_samples(histogram: Histogram, labels: dict = None) -> list:
+    """The _bucket, _sum and _count samples of one histogram, with cumulative buckets."""
+    labels = labels or {}
+    samples = []
+    seen = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        seen += count
+        samples.append(("_bucket", {**labels, "le": repr(float(bound))}, seen))
+    samples.append(("_bucket", {**labels, "le": "+Inf"}, histogram.count))
+    samples.append(("_sum", labels, histogram.sum))
+    samples.append(("_count", labels, histogram.count))
+    return samples
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families) -> str:
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {float(value)!r}" if labels else f"{name}{suffix} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """Collects metric families from registered collectors when scraped.
+
+    Components keep their own counters and histograms; collectors only read
+    them at scrape time, so nothing is paid per event beyond what the
+    components already track. Instrumentation that would add work to a hot
+    path checks `enabled` first.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """Registers collect(), which returns an iterable of families."""
+        self._collectors.append(collect)
+
+    def collect(self) -> list:
+        families = []
+        for collect in self._collectors:
+            families.extend(collect())
+        return families
+
+    def render(self) -> str:
+        return render(self.collect())
+
+
+registry = Registry()
@@ -0,0 +1,115 @@
+# bot/core/migrations.py
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+from loguru import logger
+
+from bot.core.database import STATEMENTS
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+# Arbitrary constant so that only one bot instance migrates at a time
+MIGRATION_LOCK_ID = 727_001
+
+# Statements that run on the message hot path or are known to get expensive,
+# with sample arguments to plan them with. None of them may need a sequential scan.
+HOT_QUERIES = {
+    # Runs for almost every message; planned with every part enabled
+    "load_chat_context": (1, 1, True, True, True),
+    "get_member_role": (1, 1),
+    "get_chat_config": (1,),
+    "get_filter_names": (1,),
+    "get_filter": (1, "trigger"),
+    "add_warning": (1, 1, 1),
+    "get_top_active_users": (1, 5),
+    "get_total_group_messages": (1,),
+    "get_top_active_users_hourly": (1, datetime(2024, 1, 1, tzinfo=timezone.utc), 5),
+    "get_top_active_users_daily": (1, datetime(2024, 1, 1, tzinfo=timezone.utc), 5),
+    "get_group_messages_hourly": (1, datetime(2024, 1, 1, tzinfo=timezone.utc)),
+    "get_group_messages_daily": (1, datetime(2024, 1, 1, tzinfo=timezone.utc)),
+}
+
+
+class SchemaError(Exception):
+    """Raised when the schema can't be migrated or is missing an index a hot query needs."""
+
+
+def _migration_files() -> list:
+    """Returns (version, path) for every migration, ordered by version."""
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version = int(path.name.split("_", 1)[0])
+        migrations.append((version, path))
+    return migrations
+
+
+async def run_migrations(pool: asyncpg.Pool) -> list:
+    """Applies every migration that hasn't been applied yet. Returns the versions it applied."""
+    applied_now = []
+    async with pool.acquire() as conn:
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+        try:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                """
+            )
+            applied = {row["version"] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+
+            for version, path in _migration_files():
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {path.name}...")
+                # Each migration and its bookkeeping row commit together
+                async with conn.transaction():
+                    await conn.execute(path.read_text())
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                        version, path.stem
+                    )
+                applied_now.append(version)
+        except asyncpg.PostgresError as e:
+            raise SchemaError(f"Migration failed: {e}") from e
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+    return applied_now
+
+
+def _seq_scans(plan: dict) -> list:
+    """Returns the relations read with a sequential scan anywhere in a plan tree."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def check_query_plans(pool: asyncpg.Pool):
+    """Fails if any hot query can only be planned as a sequential scan.
+
+    Sequential scans are disabled for the check, so the planner picks an index
+    whenever one exists. A Seq Scan left in the plan means the index is missing,
+    not just that the table is too small for it to matter yet.
+    """
+    problems = []
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SET LOCAL enable_seqscan = off")
+            for name, args in HOT_QUERIES.items():
+                result = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {STATEMENTS[name]}", *args)
+                # json is decoded by the pool's codec, but don't depend on it here
+                if isinstance(result, str):
+                    result = json.loads(result)
+                tables = _seq_scans(result[0]["Plan"])
+                if tables:
+                    problems.append(f"{name} scans {', '.join(tables)}")
+
+    if problems:
+        raise SchemaError("Hot queries without a usable index: " + "; ".join(problems))
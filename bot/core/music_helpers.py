@@ -1,61 +1,239 @@
 # bot/core/music_helpers.py
 import asyncio
-import os
-from yt_dlp import YoutubeDL
+import time
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
 
-# This dictionary will hold the queue for each chat
-# In a real production bot, you'd use a database (like Redis) for this
-queues = {}
+from bot.core.extraction import ExtractionPool
+from bot.core.media_cache import MediaCache
+from bot.core.metrics import SLOW_BUCKETS, Histogram
+from bot.core.music_queue import QueueManager
+from bot.core.transcode import transcode_to_pcm
 
-def get_queue(chat_id: int):
-    """Gets the queue for a specific chat."""
-    return queues.get(chat_id, [])
+# Every chat's queue, kept in memory and written through to Postgres
+music_queues = QueueManager()
 
-def add_to_queue(chat_id: int, title: str, path: str, requester: str):
-    """Adds a song to the queue."""
-    if chat_id not in queues:
-        queues[chat_id] = []
-    queues[chat_id].append({"title": title, "path": path, "requester": requester})
+def release_song(song: dict):
+    """Stops or forgets whatever a dequeued entry still holds: its download or its cache pin."""
+    task = song.get("task")
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled() and task.exception() is None and song.get("video_id"):
+        media_cache.unpin(song["video_id"])
 
-def get_next_song(chat_id: int):
-    """Gets the next song from the queue and removes it."""
-    queue = get_queue(chat_id)
-    return queue.pop(0) if queue else None
+# --- Music Downloader ---
 
-def clear_queue(chat_id: int):
-    """Clears the queue for a chat."""
-    if chat_id in queues:
-        queues[chat_id] = []
+# Downloads are stored by video id, so the same track is only ever downloaded once
+media_cache = MediaCache()
 
-# --- Music Downloader ---
+# yt-dlp runs in these worker processes, never in the bot's own process.
+# Everything submitted to it must be a picklable module-level function, and
+# imports yt_dlp itself, so the bot never loads it.
+extraction_pool = ExtractionPool()
+
+# Seconds spent downloading tracks that weren't cached, and getting queued songs ready to play
+download_time = Histogram(SLOW_BUCKETS)
+prepare_time = Histogram(SLOW_BUCKETS)
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def _resolve_query(query: str) -> dict:
+    """Finds the video a query refers to without downloading anything."""
+    from yt_dlp import YoutubeDL
 
-async def download_song(query: str) -> dict:
-    """Downloads a song from YouTube and returns its info."""
-    # Options for yt-dlp
     ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': 'downloads/%(title)s.%(ext)s', # Save to a 'downloads' folder
         'quiet': True,
         'noplaylist': True,
+        'skip_download': True,
+        # Search results only need id and title, not their formats
+        'extract_flat': 'in_playlist',
     }
-
-    loop = asyncio.get_event_loop()
-
-    # yt-dlp is not async, so we run it in a separate thread
+    target = query if query.startswith(("http://", "https://")) else f"ytsearch:{query}"
     with YoutubeDL(ydl_opts) as ydl:
-        info = await loop.run_in_executor(
-            None, lambda: ydl.extract_info(f"ytsearch:{query}", download=True)
-        )
+        info = ydl.extract_info(target, download=False)
 
     if 'entries' in info:
-        entry = info['entries'][0]
+        entries = list(info['entries'])
+        if not entries:
+            raise ValueError(f"No results for {query}")
+        entry = entries[0]
     else:
         entry = info
 
-    # The actual path to the downloaded file
-    path = ydl.prepare_filename(entry)
+    return _track_info(entry)
+
+def _track_info(entry: dict) -> dict:
+    return {
+        "id": entry['id'],
+        "title": entry.get('title') or entry['id'],
+        "url": entry.get('webpage_url') or entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}",
+    }
+
+def _resolve_page(target: str, start: int, end: int) -> list:
+    """Lists tracks start..end (1-based, inclusive) of a playlist or search, without downloading."""
+    from yt_dlp import YoutubeDL
+
+    ydl_opts = {
+        'quiet': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+        'playliststart': start,
+        'playlistend': end,
+    }
+    with YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(target, download=False)
+    entries = info.get('entries') if 'entries' in info else [info]
+    return [_track_info(entry) for entry in entries if entry and entry.get('id')]
+
+def _download_track(url: str, directory: str, transcode: bool = False) -> dict:
+    """Downloads one track into the cache directory, named by its id.
+
+    With `transcode`, the download is converted to raw PCM the voice client
+    can stream without running ffmpeg for every playback.
+    """
+    from yt_dlp import YoutubeDL
+
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': f'{directory}/%(id)s.%(ext)s',
+        'quiet': True,
+        'noplaylist': True,
+    }
+    with YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        path = ydl.prepare_filename(info)
+    if transcode:
+        return {"title": info['title'], "path": transcode_to_pcm(path), "format": "pcm"}
+    return {"title": info['title'], "path": path, "format": "source"}
+
+async def _fetch_track(chat_id: int, track: dict) -> dict:
+    # yt-dlp is not async, so it runs in the extraction worker processes
+    started = time.perf_counter()
+    result = await extraction_pool.submit(
+        chat_id, _download_track, track['url'], str(media_cache.directory), media_cache.transcode
+    )
+    download_time.observe(time.perf_counter() - started)
+    return media_cache.put(track['id'], result['path'], result['title'], result['format'])
+
+async def resolve_query(chat_id: int, query: str) -> dict:
+    """Returns {"id", "title", "url"} for a query, from the query cache when possible."""
+    key = _normalize_query(query)
+    track = media_cache.queries.get(key)
+    if track is None:
+        track = await media_cache.single_flight(
+            ("query", key), lambda: extraction_pool.submit(chat_id, _resolve_query, query)
+        )
+        media_cache.queries.set(key, track)
+    return track
+
+async def download_song(chat_id: int, query: str) -> dict:
+    """Resolves a query and returns the track's info, downloading it only if it isn't cached."""
+    return await download_track(chat_id, await resolve_query(chat_id, query))
+
+async def download_track(chat_id: int, track: dict) -> dict:
+    """Returns the info of an already resolved track ({"id", "title", "url"}), downloading it if needed."""
+    entry = media_cache.get(track['id'])
+    if entry is not None:
+        media_cache.hits += 1
+    else:
+        media_cache.misses += 1
+        # Concurrent requests for the same track share one download
+        entry = await media_cache.single_flight(("video", track['id']), lambda: _fetch_track(chat_id, track))
 
     return {
         "title": entry['title'],
-        "path": path
-    }
\ No newline at end of file
+        "path": entry['path'],
+        "format": entry.get('format', "source"),
+        "video_id": track['id'],
+    }
+
+# --- Prefetching ---
+
+# How many queued songs are downloaded ahead of the one playing
+PREFETCH_DEPTH = 2
+
+async def _prepare(chat_id: int, song: dict) -> dict:
+    started = time.perf_counter()
+    if song['video_id']:
+        # Came from a playlist or search listing, so it is resolved already
+        info = await download_track(chat_id, {"id": song['video_id'], "title": song['title'], "url": song['query']})
+    else:
+        info = await download_song(chat_id, song['query'])
+    song.update(title=info['title'], path=info['path'], format=info['format'], video_id=info['video_id'])
+    # Keep the file in the cache until it has been played
+    media_cache.pin(info['video_id'])
+    prepare_time.observe(time.perf_counter() - started)
+    return song
+
+def _consume_result(task):
+    # Failures are reported when the song comes up; this only keeps asyncio
+    # from warning about exceptions of entries that were removed before that
+    if not task.cancelled():
+        task.exception()
+
+def prepare(chat_id: int, song: dict):
+    """Starts resolving and downloading a queued song, once. Returns the task to await."""
+    if song["task"] is None:
+        song["task"] = asyncio.create_task(_prepare(chat_id, song))
+        song["task"].add_done_callback(_consume_result)
+    return song["task"]
+
+def prefetch(chat_id: int, depth: int = None):
+    """Starts preparing the first `depth` songs still waiting in the queue."""
+    for song in islice(music_queues.get(chat_id), depth or PREFETCH_DEPTH):
+        prepare(chat_id, song)
+
+# --- Playlists ---
+
+# Tracks listed per extraction job, and the most one /play may queue
+PLAYLIST_PAGE_SIZE = 25
+PLAYLIST_MAX_TRACKS = 200
+# The most results `/play -n <count>` may queue from one search
+MAX_SEARCH_RESULTS = 10
+
+def is_playlist(query: str) -> bool:
+    """Whether a query is a playlist link rather than a single track.
+
+    A watch link that also carries a list= parameter plays just its video.
+    """
+    if not query.startswith(("http://", "https://")):
+        return False
+    url = urlparse(query)
+    params = parse_qs(url.query)
+    return "list" in params and "v" not in params
+
+async def iter_tracks(chat_id: int, query: str, count: int = 1):
+    """Yields the tracks of a playlist link, or the top `count` results of a search, as they are listed.
+
+    Pages are listed in the extraction pool one at a time, with the next page
+    already being listed while the caller handles the current one.
+    """
+    if is_playlist(query):
+        target, limit = query, PLAYLIST_MAX_TRACKS
+    else:
+        # Clamped before it goes into the search target, or yt-dlp would list that many
+        limit = max(1, min(count, MAX_SEARCH_RESULTS))
+        target = f"ytsearch{limit}:{query}"
+
+    def fetch(start: int, end: int):
+        return asyncio.ensure_future(extraction_pool.submit(chat_id, _resolve_page, target, start, end))
+
+    start, end = 1, min(PLAYLIST_PAGE_SIZE, limit)
+    pending = fetch(start, end)
+    try:
+        while pending is not None:
+            page = await pending
+            # A short page means the listing is exhausted
+            if len(page) < end - start + 1 or end >= limit:
+                pending = None
+            else:
+                start, end = end + 1, min(end + PLAYLIST_PAGE_SIZE, limit)
+                pending = fetch(start, end)
+            for track in page:
+                yield track
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,206 @@
+# bot/core/music_queue.py
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from bot.core.database import Database
+
+# Fields of an entry that are stored; the rest (path, task) only live in memory
+PERSISTED_FIELDS = ("query", "title", "requester", "video_id")
+
+
+def new_entry(query: str, requester: str, title: str = None, video_id: str = None) -> dict:
+    """A queue entry. It starts pending and is resolved and downloaded by music_helpers.prepare()."""
+    return {
+        "entry_id": None,
+        "position": 0.0,
+        "query": query,
+        "title": title or query,
+        "requester": requester,
+        "video_id": video_id,
+        "path": None,
+        # The asyncio.Task downloading this entry, once prepare() started one
+        "task": None,
+    }
+
+
+class ChatQueue:
+    """One chat's music: the entries waiting in order and the one playing now."""
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.entries: deque = deque()
+        self.now_playing: Optional[dict] = None
+        # Held by every change, so changes reach the database in the order they were made
+        self.lock = asyncio.Lock()
+
+    @property
+    def playing(self) -> bool:
+        return self.now_playing is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+class QueueManager:
+    """All chats' queues in memory, written through to Postgres on every change.
+
+    Reads never touch the database. Each change is one statement, so
+    appending and popping stay O(1) in memory and one round trip in storage.
+    Changes to a chat's queue run one at a time, and memory is only updated
+    once the database write went through, so the two never disagree.
+    """
+
+    def __init__(self):
+        self.db: Database = None
+        self._queues: dict = {}
+        # Called as on_restore(client, chat_id) for each chat that was playing before a restart
+        self.on_restore: Callable[["Bot", int], Awaitable] = None
+        # Chats that were playing before the restart, until restore() resumes them
+        self._restoring: list = []
+        self._restore_tasks: set = set()
+
+    def get(self, chat_id: int) -> ChatQueue:
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = ChatQueue(chat_id)
+        return queue
+
+    @property
+    def queued_count(self) -> int:
+        """Songs waiting across all chats, not counting the ones playing."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def append(self, chat_id: int, entry: dict) -> int:
+        """Adds an entry at the end of the queue and returns its 1-based position."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            position = queue.entries[-1]["position"] + 1 if queue.entries else 0.0
+            entry["entry_id"] = await self.db.queue_add(
+                chat_id, position, *(entry[field] for field in PERSISTED_FIELDS)
+            )
+            entry["position"] = position
+            queue.entries.append(entry)
+            return len(queue.entries)
+
+    async def pop(self, chat_id: int) -> Optional[dict]:
+        """Takes the next entry off the queue and makes it the chat's current track."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            if not queue.entries:
+                return None
+            entry = queue.entries[0]
+            await self.db.queue_start(
+                chat_id, entry["entry_id"], {field: entry[field] for field in PERSISTED_FIELDS}
+            )
+            queue.entries.popleft()
+            queue.now_playing = entry
+            return entry
+
+    async def finish(self, chat_id: int):
+        """Marks the chat as no longer playing anything."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            if queue.now_playing is not None:
+                await self.db.queue_finish(chat_id)
+                queue.now_playing = None
+
+    async def remove(self, chat_id: int, index: int) -> dict:
+        """Removes the entry at a 0-based index. Raises IndexError if there is none."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            entry = queue.entries[index]
+            await self.db.queue_remove(entry["entry_id"])
+            queue.entries.remove(entry)
+            return entry
+
+    async def move(self, chat_id: int, src: int, dst: int) -> dict:
+        """Moves the entry at 0-based index src to index dst. Raises IndexError if either is out of range."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            if not (0 <= src < len(queue.entries) and 0 <= dst < len(queue.entries)):
+                raise IndexError("queue position out of range")
+            reordered = list(queue.entries)
+            entry = reordered.pop(src)
+            reordered.insert(dst, entry)
+
+            # Place it between its new neighbours, so only this row changes
+            before = reordered[dst - 1]["position"] if dst > 0 else None
+            after = reordered[dst + 1]["position"] if dst + 1 < len(reordered) else None
+            if before is None and after is None:
+                position = 0.0
+            elif before is None:
+                position = after - 1
+            elif after is None:
+                position = before + 1
+            else:
+                position = (before + after) / 2
+            await self.db.queue_set_position(entry["entry_id"], position)
+            entry["position"] = position
+            queue.entries = deque(reordered)
+            return entry
+
+    async def clear(self, chat_id: int) -> list:
+        """Empties the queue and the now-playing slot. Returns the entries that were removed."""
+        queue = self.get(chat_id)
+        async with queue.lock:
+            await self.db.queue_clear(chat_id)
+            removed = list(queue.entries)
+            if queue.now_playing is not None:
+                removed.append(queue.now_playing)
+            queue.entries.clear()
+            queue.now_playing = None
+            return removed
+
+    async def load(self, db: Database):
+        """Rebuilds every queue from the database after a restart.
+
+        A track that was playing goes back to the front of its queue, to be
+        started again by restore().
+        """
+        self.db = db
+        entries, states = await db.queue_load()
+        for row in entries:
+            entry = new_entry(row["query"], row["requester"], title=row["title"], video_id=row["video_id"])
+            entry["entry_id"] = row["entry_id"]
+            entry["position"] = row["position"]
+            self.get(row["chat_id"]).entries.append(entry)
+
+        for row in states:
+            queue = self.get(row["chat_id"])
+            playing = row["now_playing"]
+            entry = new_entry(playing["query"], playing["requester"], title=playing["title"], video_id=playing["video_id"])
+            entry["position"] = queue.entries[0]["position"] - 1 if queue.entries else 0.0
+            entry["entry_id"] = await db.queue_add(
+                queue.chat_id, entry["position"], *(entry[field] for field in PERSISTED_FIELDS)
+            )
+            queue.entries.appendleft(entry)
+            await db.queue_finish(queue.chat_id)
+
+        self._restoring = [row["chat_id"] for row in states]
+        if entries or states:
+            logger.info(f"Loaded {len(entries)} queued tracks, {len(states)} chats were playing")
+
+    def restore(self, client: "Bot"):
+        """Resumes playback in every chat that was playing before the restart.
+
+        Each chat resumes in a background task, since it may have to download
+        its track and join the voice chat first; startup doesn't wait for them.
+        """
+        if self.on_restore is not None:
+            for chat_id in self._restoring:
+                task = asyncio.create_task(self.on_restore(client, chat_id))
+                self._restore_tasks.add(task)
+                task.add_done_callback(self._restore_tasks.discard)
+                task.add_done_callback(lambda t, chat_id=chat_id: self._log_restore(t, chat_id))
+        self._restoring = []
+
+    @staticmethod
+    def _log_restore(task: asyncio.Task, chat_id: int):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Could not resume playback in {chat_id}: {task.exception()}")
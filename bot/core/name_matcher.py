@@ -0,0 +1,122 @@
+# bot/core/name_matcher.py
+import re
+import time
+from typing import Optional
+
+from loguru import logger
+
+from bot.core.cache import LRUCache
+
+# Telegram caps first and last name at 64 characters each
+MAX_NAME_LENGTH = 129
+MAX_PATTERN_LENGTH = 100
+
+# Time a single pattern may take on a worst-case name before it is rejected,
+# and the time a join check may take before it is logged as slow
+PATTERN_TIME_BUDGET = 0.005
+
+# A quantified group that itself ends in a quantifier, e.g. (a+)+ or (\w*)*,
+# is the classic shape of catastrophic backtracking
+_NESTED_QUANTIFIER = re.compile(r"[+*}]\)[+*{]")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+# Group names and conditionals clash or misbehave once patterns share one regex
+_NAMED_GROUP = re.compile(r"\(\?P<|\(\?\(")
+
+
+def _probe_time(compiled: re.Pattern, pattern: str) -> float:
+    """Times the pattern on growing strings built from its own characters plus a mismatching tail.
+
+    Stops as soon as the budget is exceeded, so exponential patterns are
+    caught on short inputs instead of being run on a full-length name.
+    """
+    chars = {c for c in pattern.lower() if c.isalnum()} or {"a"}
+    worst = 0.0
+    for length in range(8, MAX_NAME_LENGTH + 1, 8):
+        for char in chars:
+            probe = char * length + "!"
+            start = time.perf_counter()
+            compiled.search(probe)
+            elapsed = time.perf_counter() - start
+            worst = max(worst, elapsed)
+            if elapsed > PATTERN_TIME_BUDGET:
+                return elapsed
+    return worst
+
+
+def validate_pattern(pattern: str, probe: bool = True) -> Optional[str]:
+    """Returns why a banned name pattern can't be used, or None if it is fine.
+
+    `probe` also times the pattern on worst-case names. That is wall-clock
+    timing, so it is only done when a pattern is added; rebuilding a matcher
+    runs the static checks alone, since a busy loop would make stored
+    patterns fail it at random.
+    """
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"Pattern is longer than {MAX_PATTERN_LENGTH} characters."
+    try:
+        # Wrapped the same way it is in the combined matcher
+        compiled = re.compile(f"(?:{pattern})", re.IGNORECASE)
+    except re.error as e:
+        return f"Invalid regular expression: {e}"
+    if _NESTED_QUANTIFIER.search(pattern):
+        return "Nested quantifiers like `(a+)+` are not allowed."
+    if _BACKREFERENCE.search(pattern):
+        return "Backreferences are not allowed."
+    if _NAMED_GROUP.search(pattern):
+        return "Named groups and conditionals are not allowed."
+    if probe and _probe_time(compiled, pattern) > PATTERN_TIME_BUDGET:
+        return "Pattern is too slow to evaluate."
+    return None
+
+
+class NameMatcher:
+    """All banned name patterns of a chat compiled into one case-insensitive alternation."""
+
+    def __init__(self, patterns: tuple):
+        self.patterns = patterns
+        valid = []
+        for pattern in patterns:
+            # Patterns saved before validation existed may be invalid or unsafe
+            error = validate_pattern(pattern, probe=False)
+            if error:
+                logger.warning(f"Skipping banned name pattern {pattern!r}: {error}")
+                continue
+            valid.append(f"(?:{pattern})")
+        self._regexes = []
+        if not valid:
+            return
+        try:
+            self._regexes = [re.compile("|".join(valid), re.IGNORECASE)]
+        except re.error as e:
+            # Valid on their own but not together; one bad row must not stop enforcement
+            logger.warning(f"Banned name patterns don't combine ({e}), matching them one by one")
+            self._regexes = [re.compile(pattern, re.IGNORECASE) for pattern in valid]
+
+    def matches(self, name: str) -> bool:
+        if not self._regexes:
+            return False
+        start = time.perf_counter()
+        name = name[:MAX_NAME_LENGTH]
+        found = any(regex.search(name) for regex in self._regexes)
+        elapsed = time.perf_counter() - start
+        if elapsed > PATTERN_TIME_BUDGET:
+            logger.warning(f"Banned name check took {elapsed * 1000:.1f}ms for {len(self.patterns)} patterns")
+        return found
+
+
+# chat_id -> NameMatcher, rebuilt whenever the chat's pattern list changes
+name_matchers = LRUCache(maxsize=5000)
+
+
+def get_name_matcher(chat_id: int, patterns: list) -> NameMatcher:
+    """Returns the chat's compiled matcher, compiling it only when the patterns changed."""
+    patterns = tuple(patterns)
+    matcher = name_matchers.get(chat_id)
+    if matcher is None or matcher.patterns != patterns:
+        matcher = NameMatcher(patterns)
+        name_matchers.set(chat_id, matcher)
+    return matcher
+
+
+def invalidate_name_matcher(chat_id: int):
+    name_matchers.pop(chat_id)
@@ -0,0 +1,59 @@
+# bot/core/notices.py
+import asyncio
+from typing import Callable
+
+from bot.core.outbound import Priority
+
+
+class NoticeAggregator:
+    """Turns many small notices into one summary message per chat and kind.
+
+    The first notice of a kind in a chat opens a window of `window` seconds.
+    Everything added during it is sent as a single message, built by the
+    `summarize` function passed with the first notice.
+    """
+
+    def __init__(self, client: "Bot", window: float = 3.0):
+        self.client = client
+        self.window = window
+        # (chat_id, kind) -> [summarize, items]
+        self._pending: dict = {}
+        self._timers: dict = {}
+        self.notices = 0
+        self.summaries = 0
+
+    def add(self, chat_id: int, kind: str, item, summarize: Callable[[list], str]):
+        key = (chat_id, kind)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = [summarize, []]
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        pending[1].append(item)
+        self.notices += 1
+
+    def _flush(self, key: tuple):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if not pending:
+            return
+        summarize, items = pending
+        self.summaries += 1
+        self.client.outbound.send(key[0], summarize(items), priority=Priority.ANNOUNCE)
+
+    def flush_all(self):
+        """Sends every pending summary now and cancels their timers, e.g. before shutting down."""
+        for key in list(self._pending):
+            self._flush(key)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "notices": self.notices, "summaries": self.summaries}
+
+
+def list_names(names: list, limit: int = 10) -> str:
+    """Joins names for a summary, cutting the list off after `limit`."""
+    shown = ", ".join(names[:limit])
+    if len(names) > limit:
+        shown += f" and {len(names) - limit} more"
+    return shown
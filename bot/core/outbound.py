@@ -0,0 +1,310 @@
+# bot/core/outbound.py
+import asyncio
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+
+from loguru import logger
+from pyrogram.errors import FloodWait
+
+from bot.core.cache import LRUCache
+from bot.core.metrics import Histogram
+
+
+class Priority(IntEnum):
+    """Order in which queued API calls are sent; lower goes first."""
+    MODERATION = 0  # deletions, bans, kicks and mutes
+    COMMAND = 1     # answers to commands
+    FILTER = 2      # filter replies
+    ANNOUNCE = 3    # now playing, errors and other notices
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available; 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("chat_id", "priority", "func", "args", "kwargs", "is_message", "key", "future", "queued_at", "attempts")
+
+    def __init__(self, chat_id, priority, func, args, kwargs, is_message, key, future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.is_message = is_message
+        self.key = key
+        self.future = future
+        self.queued_at = time.perf_counter()
+        self.attempts = 0
+
+
+def _consume_result(future: asyncio.Future):
+    # Most callers don't await their calls; this keeps asyncio from warning about their failures
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundScheduler:
+    """Sends every Telegram API call the plugins make, within Telegram's rate limits.
+
+    Calls wait in one lane per chat within each priority. Higher priorities
+    always go first, and chats within a priority take turns. All calls share
+    a global token bucket, and messages also take from their chat's bucket.
+    A FloodWait holds back the chat it happened in (or every chat, for calls
+    without one) for the time Telegram asked, then the call is retried.
+
+    Calls submitted with a `key` coalesce: while one with the same key is
+    still queued, a new one replaces its arguments instead of queuing again.
+    """
+
+    def __init__(self, client: "Bot", global_rate: float = 25.0, chat_rate: float = 20 / 60, chat_burst: int = 3,
+                 max_in_flight: int = 8, max_queue: int = 2000, max_retries: int = 3):
+        self.client = client
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        # One OrderedDict of chat_id -> deque of jobs per priority; key order is the round-robin order
+        self._lanes = [OrderedDict() for _ in Priority]
+        self._keys: dict = {}
+        self._queued = 0
+        self._in_flight = 0
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = LRUCache(maxsize=20000)
+        # chat_id (None for the whole bot) -> monotonic time a FloodWait ends
+        self._blocked: dict = {}
+        # Created here rather than in start(), so calls can be submitted before the runner starts
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task = None
+        # Calls being sent; kept here because the loop only holds weak references to tasks
+        self._sending: set = set()
+        self.wait_time = {priority: Histogram() for priority in Priority}
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Gives queued calls up to `timeout` seconds to go out, then cancels the rest."""
+        deadline = time.monotonic() + timeout
+        while self._runner and (self._queued or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+        for lanes in self._lanes:
+            for lane in lanes.values():
+                for job in lane:
+                    job.future.cancel()
+            lanes.clear()
+        self._keys.clear()
+        self._queued = 0
+
+    # --- Submitting ---
+
+    def submit(self, chat_id, priority: Priority, func, *args, key=None, is_message: bool = False, **kwargs) -> asyncio.Future:
+        """Queues func(*args, **kwargs) and returns a future for its result.
+
+        Awaiting the future is optional. `is_message` marks calls that post
+        to the chat and so count against its message limit. When the queue
+        is full, calls less important than everything queued resolve to None
+        without being sent; moderation calls are always queued.
+        """
+        if key is not None and key in self._keys:
+            job = self._keys[key]
+            job.func, job.args, job.kwargs = func, args, kwargs
+            self.coalesced += 1
+            return job.future
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_result)
+        if self._queued >= self.max_queue and priority != Priority.MODERATION and not self._shed(priority):
+            self.dropped += 1
+            future.set_result(None)
+            return future
+
+        job = _Job(chat_id, priority, func, args, kwargs, is_message, key, future)
+        self._lanes[priority].setdefault(chat_id, deque()).append(job)
+        self._queued += 1
+        if key is not None:
+            self._keys[key] = job
+        self._wakeup.set()
+        return future
+
+    def _shed(self, priority: Priority) -> bool:
+        """Drops the newest queued call of the least important priority below `priority`, if there is one."""
+        for lanes in reversed(self._lanes[priority + 1:]):
+            if not lanes:
+                continue
+            chat_id, lane = next(reversed(lanes.items()))
+            job = lane.pop()
+            if not lane:
+                del lanes[chat_id]
+            self._forget(job)
+            self.dropped += 1
+            job.future.set_result(None)
+            return True
+        return False
+
+    def _forget(self, job: _Job):
+        self._queued -= 1
+        if job.key is not None and self._keys.get(job.key) is job:
+            del self._keys[job.key]
+
+    def reply(self, message, text: str, priority: Priority = Priority.COMMAND, key=None, **kwargs) -> asyncio.Future:
+        """Queues message.reply_text(text)."""
+        return self.submit(message.chat.id, priority, message.reply_text, text, key=key, is_message=True, **kwargs)
+
+    def send(self, chat_id: int, text: str, priority: Priority = Priority.ANNOUNCE, key=None, **kwargs) -> asyncio.Future:
+        """Queues client.send_message(chat_id, text)."""
+        return self.submit(chat_id, priority, self.client.send_message, chat_id, text, key=key, is_message=True, **kwargs)
+
+    def delete(self, message) -> asyncio.Future:
+        """Queues the deletion of a message, as a moderation action."""
+        return self.submit(message.chat.id, Priority.MODERATION, message.delete)
+
+    # --- Sending ---
+
+    def _chat_delay(self, job: _Job, now: float) -> float:
+        delay = self._blocked.get(job.chat_id, 0.0) - now
+        if job.is_message:
+            bucket = self._chat_buckets.get(job.chat_id)
+            if bucket is not None:
+                delay = max(delay, bucket.delay(now))
+        return delay
+
+    def _next_job(self, now: float):
+        """Returns (job, None) for the next call that may go out now, or (None, seconds until one may)."""
+        delay = max(self._blocked.get(None, 0.0) - now, self._global.delay(now))
+        if delay > 0:
+            return None, delay
+
+        soonest = None
+        for lanes in self._lanes:
+            for chat_id, lane in lanes.items():
+                job = lane[0]
+                delay = self._chat_delay(job, now)
+                if delay > 0:
+                    soonest = delay if soonest is None else min(soonest, delay)
+                    continue
+
+                lane.popleft()
+                if lane:
+                    lanes.move_to_end(chat_id)
+                else:
+                    del lanes[chat_id]
+                self._forget(job)
+                self._global.take(now)
+                if job.is_message:
+                    bucket = self._chat_buckets.get(chat_id)
+                    if bucket is None:
+                        bucket = TokenBucket(self.chat_rate, self.chat_burst)
+                        self._chat_buckets.set(chat_id, bucket)
+                    bucket.take(now)
+                return job, None
+        return None, soonest
+
+    async def _run(self):
+        while True:
+            if self._in_flight >= self.max_in_flight:
+                job, delay = None, None
+            else:
+                job, delay = self._next_job(time.monotonic())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._in_flight += 1
+            task = asyncio.create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, job: _Job):
+        self.wait_time[job.priority].observe(time.perf_counter() - job.queued_at)
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+        except FloodWait as e:
+            self.flood_waits += 1
+            now = time.monotonic()
+            self._blocked = {chat_id: until for chat_id, until in self._blocked.items() if until > now}
+            self._blocked[job.chat_id] = now + e.value
+            logger.warning(f"FloodWait of {e.value}s in {job.chat_id}")
+            job.attempts += 1
+            if job.attempts <= self.max_retries and not job.future.done():
+                # Back to the front of its lane, to go first once the wait is over
+                self._lanes[job.priority].setdefault(job.chat_id, deque()).appendleft(job)
+                self._queued += 1
+                if job.key is not None:
+                    self._keys.setdefault(job.key, job)
+            elif not job.future.done():
+                self.failed += 1
+                job.future.set_exception(e)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queue_depth": self._queued,
+            "queued": {priority.name.lower(): sum(map(len, self._lanes[priority].values())) for priority in Priority},
+            "in_flight": self._in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "blocked_chats": sum(1 for until in self._blocked.values() if until > now),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "wait_p99_ms": {
+                priority.name.lower(): self.wait_time[priority].quantile(0.99) * 1000 for priority in Priority
+            },
+        }
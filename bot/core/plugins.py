@@ -0,0 +1,28 @@
+# bot/core/plugins.py
+from pathlib import Path
+
+
+def plugin_modules(root: str) -> list:
+    """Every plugin module under `root` as a dotted path relative to it, in the order pyrogram loads them."""
+    return [
+        ".".join(path.relative_to(root).with_suffix("").parts)
+        for path in sorted(Path(root).rglob("*.py"))
+        if path.name != "__init__.py"
+    ]
+
+
+def select_plugins(root: str, names: list) -> list:
+    """Expands plugin names into the modules to pass to pyrogram as `include`.
+
+    A name is either a module ("management.locks") or a package
+    ("moderation"), which stands for every module in it. pyrogram's own
+    include only takes modules.
+    """
+    modules = plugin_modules(root)
+    selected = set()
+    for name in names:
+        matched = [module for module in modules if module == name or module.startswith(name + ".")]
+        if not matched:
+            raise ValueError(f"No plugin named '{name}' under {root}/, available: {', '.join(modules)}")
+        selected.update(matched)
+    return [module for module in modules if module in selected]
@@ -0,0 +1,96 @@
+# bot/core/raid.py
+import time
+from collections import deque
+
+from loguru import logger
+
+# Locks every chat gets on top of its own while it is being raided
+RAID_LOCKS = {"links": True, "media": True}
+
+# Violation history is pruned once this many chats have some
+MAX_TRACKED_CHATS = 10000
+
+
+class RaidMonitor:
+    """Counts violations per chat and puts a chat in raid mode when they come too fast.
+
+    Raid mode starts once a chat has `threshold` violations within `window`
+    seconds, and ends after `cooldown` seconds without any. While it lasts,
+    RAID_LOCKS apply and the bot stops answering individual messages.
+    """
+
+    def __init__(self, threshold: int = 20, window: float = 10.0, cooldown: float = 300.0):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        # chat_id -> monotonic times of recent violations
+        self._hits: dict = {}
+        # chat_id -> monotonic time raid mode ends, unless extended
+        self._until: dict = {}
+        self.raids = 0
+
+    def record(self, chat_id: int) -> bool:
+        """Counts a violation. Returns True if it just put the chat in raid mode."""
+        now = time.monotonic()
+        if self.active(chat_id):
+            self._until[chat_id] = now + self.cooldown
+            return False
+
+        if len(self._hits) >= MAX_TRACKED_CHATS:
+            self.prune()
+        hits = self._hits.setdefault(chat_id, deque())
+        hits.append(now)
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if len(hits) < self.threshold:
+            return False
+
+        del self._hits[chat_id]
+        self._until[chat_id] = now + self.cooldown
+        self.raids += 1
+        logger.warning(f"Raid mode on in {chat_id}: {self.threshold} violations within {self.window}s")
+        return True
+
+    def active(self, chat_id: int) -> bool:
+        until = self._until.get(chat_id)
+        if until is None:
+            return False
+        if until > time.monotonic():
+            return True
+        del self._until[chat_id]
+        logger.info(f"Raid mode over in {chat_id}")
+        return False
+
+    def prune(self):
+        """Forgets violation history that can no longer trigger raid mode."""
+        cutoff = time.monotonic() - self.window
+        for chat_id in [chat_id for chat_id, hits in self._hits.items() if not hits or hits[-1] <= cutoff]:
+            del self._hits[chat_id]
+
+    def clear(self):
+        """Forgets all violation history and ends raid mode everywhere; the raid count is kept."""
+        self._hits.clear()
+        self._until.clear()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "raids": self.raids,
+            "active": sum(1 for until in self._until.values() if until > now),
+            "tracked_chats": len(self._hits),
+        }
+
+
+# Raid state is per process, like the other per-chat caches
+raid_monitor = RaidMonitor()
+
+
+def record_violation(client: "Bot", chat_id: int):
+    """Counts a violation in a chat and tells the chat if that started raid mode."""
+    if raid_monitor.record(chat_id):
+        client.outbound.send(
+            chat_id,
+            "🚨 **Raid mode on.** Links and media are locked and replies are paused "
+            "until things calm down.",
+            key=("raid", chat_id),
+        )
@@ -0,0 +1,43 @@
+# bot/core/transcode.py
+import os
+import subprocess
+
+# The format the voice client sends: signed 16-bit little-endian PCM, 48 kHz mono.
+# A file already in this format is streamed as-is, with no ffmpeg per playback.
+# py-tgcalls 0.9 always reads raw input as a single channel.
+PCM_SAMPLE_RATE = 48000
+PCM_CHANNELS = 1
+PCM_FORMAT = "s16le"
+PCM_BYTES_PER_SECOND = PCM_SAMPLE_RATE * PCM_CHANNELS * 2
+
+# Extension of transcoded files in the media cache
+PCM_SUFFIX = ".pcm"
+
+
+def ffmpeg_pcm_args(source: str, output: str = "pipe:1") -> list:
+    """The ffmpeg command line that decodes any audio file into the voice client's PCM format."""
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-i", source,
+        "-vn", "-f", PCM_FORMAT, "-ac", str(PCM_CHANNELS), "-ar", str(PCM_SAMPLE_RATE),
+        output,
+    ]
+
+
+def transcode_to_pcm(source: str) -> str:
+    """Decodes a downloaded track into raw PCM next to it and deletes the original.
+
+    Blocking; it runs in an extraction worker process. Returns the new path.
+    """
+    output = os.path.splitext(source)[0] + PCM_SUFFIX
+    tmp = output + ".part"
+    try:
+        subprocess.run(ffmpeg_pcm_args(source, tmp), check=True, capture_output=True)
+        os.replace(tmp, output)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}") from e
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    os.remove(source)
+    return output
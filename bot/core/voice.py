@@ -0,0 +1,394 @@
+# bot/core/voice.py
+import asyncio
+import itertools
+import multiprocessing
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from loguru import logger
+from pyrogram import Client
+
+from bot.core.transcode import PCM_SAMPLE_RATE
+
+# pytgcalls is imported where it is first used, so it is only loaded once a
+# chat actually plays something, and never by the bot process in worker mode
+
+# How long a command to a voice worker may take before the caller gives up
+WORKER_CALL_TIMEOUT = 60.0
+
+# How long a new voice worker may take to log in and report ready before it is killed
+WORKER_START_TIMEOUT = 60.0
+
+# A worker that dies is restarted after a backoff that doubles with each recent
+# restart, up to WORKER_RESTART_MAX_DELAY. Every restart logs the bot token in
+# again, so after WORKER_MAX_RESTARTS within WORKER_RESTART_WINDOW seconds the
+# worker is given up on rather than risk an auth FloodWait for the whole bot.
+WORKER_RESTART_DELAY = 1.0
+WORKER_RESTART_MAX_DELAY = 60.0
+WORKER_MAX_RESTARTS = 5
+WORKER_RESTART_WINDOW = 600.0
+
+# Called as handler(client, chat_id) whenever a chat's track finishes, whichever backend played it
+_stream_end_handlers: list = []
+
+# Tasks started from pipe callbacks; the loop only keeps weak references to them
+_background_tasks: set = set()
+
+
+def on_stream_end(func: Callable[["Bot", int], Awaitable]):
+    """Registers a stream-end handler. Usable as a decorator."""
+    _stream_end_handlers.append(func)
+    return func
+
+
+async def dispatch_stream_end(client: "Bot", chat_id: int):
+    for handler in _stream_end_handlers:
+        try:
+            await handler(client, chat_id)
+        except Exception as e:
+            logger.error(f"Stream end handler failed in {chat_id}: {e}")
+
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def build_stream(path: str, format: str):
+    """The input stream for a prepared file: raw PCM is sent as-is, anything else goes through ffmpeg."""
+    from pytgcalls.types import AudioParameters, AudioPiped, InputAudioStream, InputStream
+
+    if format == "pcm":
+        return InputStream(InputAudioStream(path, AudioParameters(bitrate=PCM_SAMPLE_RATE)))
+    return AudioPiped(path)
+
+
+class LocalVoice:
+    """Plays audio from inside the current process, on its event loop."""
+
+    def __init__(self, client: Client, on_end: Callable[[int], Awaitable] = None):
+        from pytgcalls import PyTgCalls
+
+        self.client = client
+        self.calls = PyTgCalls(client)
+        # Chats this client is in the voice chat of
+        self._active: set = set()
+        self._on_end = on_end or (lambda chat_id: dispatch_stream_end(client, chat_id))
+
+    async def start(self):
+        @self.calls.on_stream_end()
+        async def _ended(_, update):
+            await self._on_end(update.chat_id)
+
+        await self.calls.start()
+
+    async def play(self, chat_id: int, path: str, format: str = "source"):
+        """Starts a file in a chat's voice chat, joining it first if needed."""
+        stream = build_stream(path, format)
+        if chat_id in self._active:
+            await self.calls.change_stream(chat_id, stream)
+        else:
+            await self.calls.join_group_call(chat_id, stream)
+            self._active.add(chat_id)
+
+    async def leave(self, chat_id: int):
+        self._active.discard(chat_id)
+        await self.calls.leave_group_call(chat_id)
+
+    async def stop(self):
+        # PyTgCalls has no stop(); leaving every call is what ends the streams
+        for chat_id in list(self._active):
+            try:
+                await self.leave(chat_id)
+            except Exception as e:
+                logger.warning(f"Could not leave the voice chat in {chat_id}: {e}")
+
+    def stats(self) -> dict:
+        return {"mode": "local", "active_chats": len(self._active)}
+
+
+# --- Worker processes ---
+# Messages over a worker's pipe are tuples:
+#   bot -> worker: ("call", request_id, op, chat_id, args) and ("stop",)
+#   worker -> bot: ("ready",), ("result", request_id, error or None) and ("stream_end", chat_id)
+
+def _worker_main(conn, index: int, api_id: int, api_hash: str, bot_token: str):
+    """Entry point of a voice worker process."""
+    asyncio.run(_serve(conn, index, api_id, api_hash, bot_token))
+
+
+async def _serve(conn, index: int, api_id: int, api_hash: str, bot_token: str):
+    loop = asyncio.get_running_loop()
+    app = Client(f"voice-worker-{index}", api_id=api_id, api_hash=api_hash, bot_token=bot_token, in_memory=True)
+    await app.start()
+
+    async def forward_end(chat_id: int):
+        conn.send(("stream_end", chat_id))
+
+    voice = LocalVoice(app, on_end=forward_end)
+    await voice.start()
+    stopping = asyncio.Event()
+
+    async def handle(request_id: int, op: str, chat_id: int, args: tuple):
+        try:
+            await getattr(voice, op)(chat_id, *args)
+        except Exception as e:
+            conn.send(("result", request_id, f"{type(e).__name__}: {e}"))
+        else:
+            conn.send(("result", request_id, None))
+
+    def on_readable():
+        while conn.poll():
+            try:
+                message = conn.recv()
+            except EOFError:
+                # The bot is gone
+                stopping.set()
+                return
+            if message[0] == "stop":
+                stopping.set()
+            elif message[0] == "call":
+                _run_in_background(handle(*message[1:]))
+
+    loop.add_reader(conn.fileno(), on_readable)
+    conn.send(("ready",))
+    logger.info(f"Voice worker {index} ready")
+    try:
+        await stopping.wait()
+    finally:
+        loop.remove_reader(conn.fileno())
+        await voice.stop()
+        await app.stop()
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.ready = asyncio.Event()
+        # request_id -> future waiting for the worker's answer
+        self.pending: dict = {}
+        self.chats: set = set()
+        # Monotonic times of recent restarts, for the backoff and the restart limit
+        self.restarts: deque = deque()
+        self.respawn: asyncio.Task = None
+        # Set once it crashed too often; no chats are assigned to it after that
+        self.dead = False
+
+    def kill(self):
+        """Stops the process at once and closes the bot's end of its pipe."""
+        if self.respawn:
+            self.respawn.cancel()
+        if self.conn and not self.conn.closed:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self.conn.close()
+        if self.process and self.process.is_alive():
+            self.process.kill()
+
+
+class RemoteVoice:
+    """Plays audio in separate worker processes, each with its own client and event loop.
+
+    A chat stays on one worker while it is in a voice chat. New chats go to
+    the worker with the fewest, unless `pinned` assigns them to a fixed one.
+    If a worker dies its chats get a stream end so their queues move on,
+    and it is restarted after a backoff, unless it has crashed too often
+    lately; then it is left dead and its chats go to the others.
+    """
+
+    def __init__(self, client: "Bot", workers: int, api_id: int, api_hash: str, bot_token: str, pinned: dict = None):
+        self.client = client
+        self._credentials = (api_id, api_hash, bot_token)
+        self._workers = [_Worker(index) for index in range(workers)]
+        # chat_id -> worker index, for chats that must always use the same worker
+        self.pinned = pinned or {}
+        self._assigned: dict = {}
+        self._request_ids = itertools.count()
+        self._stopping = False
+        self.restarts = 0
+
+    async def start(self):
+        try:
+            for worker in self._workers:
+                self._spawn(worker)
+            await asyncio.wait_for(
+                asyncio.gather(*(worker.ready.wait() for worker in self._workers)), WORKER_START_TIMEOUT
+            )
+        except Exception as e:
+            # Don't leave any half-started workers behind
+            self._stopping = True
+            waiting = [worker.index for worker in self._workers if not worker.ready.is_set()]
+            for worker in self._workers:
+                worker.kill()
+            for worker in self._workers:
+                if worker.process:
+                    await asyncio.to_thread(worker.process.join, 5)
+            if isinstance(e, asyncio.TimeoutError):
+                raise RuntimeError(f"voice workers {waiting} did not start within {WORKER_START_TIMEOUT}s") from None
+            raise
+        logger.info(f"Started {len(self._workers)} voice workers")
+
+    def _spawn(self, worker: _Worker):
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        worker.process = ctx.Process(
+            target=_worker_main, args=(child_conn, worker.index, *self._credentials),
+            name=f"voice-worker-{worker.index}", daemon=True,
+        )
+        worker.process.start()
+        # Only the child holds its end now, so its exit shows up here as EOF
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.ready.clear()
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_readable, worker)
+
+    def _on_readable(self, worker: _Worker):
+        while True:
+            try:
+                if not worker.conn.poll():
+                    return
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                self._lost(worker)
+                return
+
+            kind = message[0]
+            if kind == "result":
+                future = worker.pending.pop(message[1], None)
+                if future and not future.done():
+                    if message[2] is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(RuntimeError(message[2]))
+            elif kind == "stream_end":
+                _run_in_background(dispatch_stream_end(self.client, message[1]))
+            elif kind == "ready":
+                worker.ready.set()
+
+    def _lost(self, worker: _Worker):
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"voice worker {worker.index} exited"))
+        worker.pending.clear()
+        chats = worker.chats
+        worker.chats = set()
+        for chat_id in chats:
+            self._assigned.pop(chat_id, None)
+        if self._stopping:
+            return
+
+        # Their calls died with the worker; let each queue carry on with its next track
+        for chat_id in chats:
+            _run_in_background(dispatch_stream_end(self.client, chat_id))
+
+        now = time.monotonic()
+        while worker.restarts and worker.restarts[0] <= now - WORKER_RESTART_WINDOW:
+            worker.restarts.popleft()
+        if len(worker.restarts) >= WORKER_MAX_RESTARTS:
+            worker.dead = True
+            logger.error(
+                f"Voice worker {worker.index} exited {WORKER_MAX_RESTARTS} times within "
+                f"{WORKER_RESTART_WINDOW}s, not restarting it ({len(chats)} chats affected)"
+            )
+            return
+
+        worker.restarts.append(now)
+        self.restarts += 1
+        delay = min(WORKER_RESTART_MAX_DELAY, WORKER_RESTART_DELAY * 2 ** (len(worker.restarts) - 1))
+        # Jitter, so workers that died together don't all log in at the same moment
+        delay = random.uniform(delay / 2, delay)
+        logger.error(
+            f"Voice worker {worker.index} exited, restarting it in {delay:.1f}s ({len(chats)} chats affected)"
+        )
+        worker.respawn = asyncio.create_task(self._respawn(worker, delay))
+
+    async def _respawn(self, worker: _Worker, delay: float):
+        await asyncio.sleep(delay)
+        if self._stopping:
+            return
+        self._spawn(worker)
+        try:
+            await asyncio.wait_for(worker.ready.wait(), WORKER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Voice worker {worker.index} did not start within {WORKER_START_TIMEOUT}s, killing it")
+            # Its pipe then reads EOF, which counts as another exit
+            worker.process.kill()
+
+    def _assign(self, chat_id: int) -> _Worker:
+        index = self._assigned.get(chat_id)
+        if index is None:
+            index = self.pinned.get(chat_id)
+            if index is None or index >= len(self._workers) or self._workers[index].dead:
+                alive = [worker for worker in self._workers if not worker.dead]
+                if not alive:
+                    raise ConnectionError("every voice worker has crashed too often to be restarted")
+                index = min(alive, key=lambda worker: len(worker.chats)).index
+            self._assigned[chat_id] = index
+        worker = self._workers[index]
+        worker.chats.add(chat_id)
+        return worker
+
+    async def _call(self, worker: _Worker, op: str, chat_id: int, *args):
+        if worker.dead:
+            raise ConnectionError(f"voice worker {worker.index} is dead")
+        await asyncio.wait_for(worker.ready.wait(), WORKER_CALL_TIMEOUT)
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        worker.conn.send(("call", request_id, op, chat_id, args))
+        try:
+            return await asyncio.wait_for(future, WORKER_CALL_TIMEOUT)
+        finally:
+            worker.pending.pop(request_id, None)
+
+    async def play(self, chat_id: int, path: str, format: str = "source"):
+        """Starts a file in a chat's voice chat on the chat's worker."""
+        joining = chat_id not in self._assigned
+        worker = self._assign(chat_id)
+        try:
+            await self._call(worker, "play", chat_id, path, format)
+        except Exception:
+            if joining:
+                # Never made it into the voice chat, so don't keep the worker slot
+                self._assigned.pop(chat_id, None)
+                worker.chats.discard(chat_id)
+            raise
+
+    async def leave(self, chat_id: int):
+        index = self._assigned.pop(chat_id, None)
+        if index is None:
+            return
+        worker = self._workers[index]
+        worker.chats.discard(chat_id)
+        await self._call(worker, "leave", chat_id)
+
+    async def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            if worker.respawn:
+                worker.respawn.cancel()
+        for worker in self._workers:
+            if worker.process and worker.process.is_alive():
+                try:
+                    worker.conn.send(("stop",))
+                except OSError:
+                    pass
+        for worker in self._workers:
+            if worker.process:
+                await asyncio.to_thread(worker.process.join, 10)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def stats(self) -> dict:
+        return {
+            "mode": "workers",
+            "workers": [len(worker.chats) for worker in self._workers],
+            "dead": [worker.index for worker in self._workers if worker.dead],
+            "restarts": self.restarts,
+        }
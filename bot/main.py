@@ -1,14 +1,38 @@
 # bot/main.py
+import time
+
+# Taken before the imports below, so the reported startup time includes them
+PROCESS_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+import resource
+from pathlib import Path
 
 import asyncpg
 from environs import Env
 from loguru import logger
 from pyrogram import Client
-from pytgcalls import PyTgCalls # <-- NEW IMPORT
+
+from bot.core.activity import ActivityBuffer
+from bot.core.chat_config import ConfigListener, chat_configs
+from bot.core.migrations import SchemaError, check_query_plans, run_migrations
+from bot.core.music_helpers import extraction_pool, media_cache, music_queues
+from bot.core.database import Database, init_connection, known_users, log_query_stats, member_roles
+from bot.core.deletions import DeletionBatcher
+from bot.core.dispatcher import LaneDispatcher
+from bot.core.exporter import MetricsServer, collector
+from bot.core.load import load_monitor
+from bot.core.metrics import registry
+from bot.core.notices import NoticeAggregator
+from bot.core.outbound import OutboundScheduler
+from bot.core.plugins import select_plugins
+from bot.core.raid import raid_monitor
+from bot.core.voice import LocalVoice, RemoteVoice
 
 # ... (keep the rest of your imports and config setup) ...
+IMPORTS_DONE = time.perf_counter()
+
 # --- Environment Setup ---
 env = Env()
 env.read_env()
@@ -22,59 +46,292 @@ DB_PASS = env.str("DB_PASS")
 DB_NAME = env.str("DB_NAME")
 DB_HOST = env.str("DB_HOST")
 
+# Plugin packages or modules to load, relative to plugins/, e.g. "moderation,management";
+# empty loads all of them. Leaving out "music" also skips the music stack at startup
+PLUGIN_ROOT = "plugins"
+PLUGINS = env.list("PLUGINS", [])
+
+# Fail startup if a hot query has no usable index
+SCHEMA_CHECK_PLANS = env.bool("SCHEMA_CHECK_PLANS", True)
+
+# Activity logging is buffered in memory and written in batches
+ACTIVITY_FLUSH_INTERVAL = env.float("ACTIVITY_FLUSH_INTERVAL", 10.0)
+ACTIVITY_MAX_BUFFER = env.int("ACTIVITY_MAX_BUFFER", 5000)
+
+# Number of users whose database row is known to be current
+USER_CACHE_SIZE = env.int("USER_CACHE_SIZE", 50000)
+
+# Decoded per-chat config, invalidated on writes and through LISTEN/NOTIFY
+CHAT_CONFIG_CACHE_SIZE = env.int("CHAT_CONFIG_CACHE_SIZE", 10000)
+CHAT_CONFIG_TTL = env.float("CHAT_CONFIG_TTL", 300.0)
+
+# Member roles (including "no role"), invalidated by role changes
+ROLE_CACHE_SIZE = env.int("ROLE_CACHE_SIZE", 100000)
+ROLE_CACHE_TTL = env.float("ROLE_CACHE_TTL", 600.0)
+
+# Downloaded tracks, keyed by video id and kept under a disk budget
+MEDIA_CACHE_DIR = env.str("MEDIA_CACHE_DIR", "downloads")
+MEDIA_CACHE_MAX_MB = env.int("MEDIA_CACHE_MAX_MB", 2048)
+QUERY_CACHE_TTL = env.float("QUERY_CACHE_TTL", 6 * 3600.0)
+# Store tracks as raw PCM so playback needs no ffmpeg decode (about 5.8 MB per minute of audio)
+MEDIA_TRANSCODE = env.bool("MEDIA_TRANSCODE", False)
+
+# Worker processes running yt-dlp, and how many jobs may wait for them
+EXTRACTION_WORKERS = env.int("EXTRACTION_WORKERS", 2)
+EXTRACTION_MAX_QUEUE = env.int("EXTRACTION_MAX_QUEUE", 100)
+
+# Voice chats run in this many worker processes; 0 keeps them in the bot's own process.
+# VOICE_PINNED_CHATS assigns chats to fixed workers, e.g. "-100123=0,-100456=1".
+VOICE_WORKERS = env.int("VOICE_WORKERS", 0)
+VOICE_PINNED_CHATS = env.dict("VOICE_PINNED_CHATS", {}, subcast_keys=int, subcast_values=int)
+
+# Outgoing API calls, kept within Telegram's limits: about 30 messages a second
+# overall and 20 a minute per group
+OUTBOUND_GLOBAL_RATE = env.float("OUTBOUND_GLOBAL_RATE", 25.0)
+OUTBOUND_CHAT_PER_MINUTE = env.float("OUTBOUND_CHAT_PER_MINUTE", 20.0)
+OUTBOUND_CHAT_BURST = env.int("OUTBOUND_CHAT_BURST", 3)
+OUTBOUND_MAX_IN_FLIGHT = env.int("OUTBOUND_MAX_IN_FLIGHT", 8)
+OUTBOUND_MAX_QUEUE = env.int("OUTBOUND_MAX_QUEUE", 2000)
+
+# Lock deletions are collected per chat for this long and sent as one call
+DELETE_BATCH_WINDOW = env.float("DELETE_BATCH_WINDOW", 0.5)
+
+# Notices like anti-bot kicks are summed up in one message per chat for this long
+NOTICE_WINDOW = env.float("NOTICE_WINDOW", 3.0)
+
+# Anti-bot kicks running at once across all join messages; the rest wait their turn
+KICK_CONCURRENCY = env.int("KICK_CONCURRENCY", 5)
+
+# Raid mode: this many lock violations within RAID_WINDOW seconds tighten a
+# chat's locks and pause replies until RAID_COOLDOWN seconds pass without one
+RAID_THRESHOLD = env.int("RAID_THRESHOLD", 20)
+RAID_WINDOW = env.float("RAID_WINDOW", 10.0)
+RAID_COOLDOWN = env.float("RAID_COOLDOWN", 300.0)
+
+# Updates are sharded by chat onto this many lanes, each running up to
+# UPDATE_LANE_CONCURRENCY chats at once; a lane with more than
+# UPDATE_LANE_WARN_BACKLOG waiting updates is logged. 0 lanes keeps pyrogram's
+# shared worker pool.
+UPDATE_LANES = env.int("UPDATE_LANES", 8)
+UPDATE_LANE_CONCURRENCY = env.int("UPDATE_LANE_CONCURRENCY", 4)
+UPDATE_LANE_WARN_BACKLOG = env.int("UPDATE_LANE_WARN_BACKLOG", 1000)
+
+# Load shedding, driven by the update lanes: best-effort handlers (activity,
+# filter replies) stop at the DEGRADED thresholds, everything but moderation at
+# the OVERLOADED ones. Backlog is in updates, lag is the oldest update's age.
+LOAD_DEGRADE_BACKLOG = env.int("LOAD_DEGRADE_BACKLOG", 200)
+LOAD_OVERLOAD_BACKLOG = env.int("LOAD_OVERLOAD_BACKLOG", 1000)
+LOAD_DEGRADE_LAG = env.float("LOAD_DEGRADE_LAG", 2.0)
+LOAD_OVERLOAD_LAG = env.float("LOAD_OVERLOAD_LAG", 10.0)
+LOAD_RECOVER_AFTER = env.float("LOAD_RECOVER_AFTER", 10.0)
+
+# Prometheus-style metrics at http://METRICS_HOST:METRICS_PORT/metrics; 0 turns
+# them off, along with the per-handler timing that only runs while they're on
+METRICS_PORT = env.int("METRICS_PORT", 0)
+METRICS_HOST = env.str("METRICS_HOST", "127.0.0.1")
+
 # --- Logging Setup ---
-logging.basicConfig(level=logging.INFO)
 loguru_logger = logger
-loguru_logger.add(
-    "logs/bot.log", rotation="10 MB", retention="10 days", level="INFO"
-)
+
+def setup_logging():
+    """Adds the log file sink. Only the bot process calls this, so worker
+    processes never rotate the same file."""
+    logging.basicConfig(level=logging.INFO)
+    loguru_logger.add(
+        "logs/bot.log", rotation="10 MB", retention="10 days", level="INFO"
+    )
+
+def memory_usage() -> str:
+    """This process's resident memory, for the startup logs."""
+    # ru_maxrss is in KB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        return f"peak RSS {peak:.0f} MB"
+    return f"RSS {rss:.0f} MB, peak {peak:.0f} MB"
 
 class Bot(Client):
     def __init__(self):
+        plugins = dict(root=PLUGIN_ROOT)
+        if PLUGINS:
+            plugins["include"] = select_plugins(PLUGIN_ROOT, PLUGINS)
         super().__init__(
             name="my_bot",
             api_id=API_ID,
             api_hash=API_HASH,
             bot_token=BOT_TOKEN,
-            plugins=dict(root="plugins"),
+            plugins=plugins,
         )
+        # Queues, the media cache and extraction only matter if the music plugins are loaded
+        self.music = "include" not in plugins or any(module.startswith("music.") for module in plugins["include"])
+        if UPDATE_LANES > 0:
+            # Strict order within a chat, different chats in parallel
+            self.dispatcher = LaneDispatcher(
+                self, lanes=UPDATE_LANES, concurrency=UPDATE_LANE_CONCURRENCY, warn_backlog=UPDATE_LANE_WARN_BACKLOG
+            )
         self.log = loguru_logger
         self.owner_id = OWNER_ID
-        self.db: asyncpg.Pool = None
-        self.voice_client: PyTgCalls = None # <-- NEW ATTRIBUTE
+        self.db: Database = None
+        # Started by get_voice() when the first track plays
+        self.voice: LocalVoice | RemoteVoice = None
+        self._voice_lock = asyncio.Lock()
+        self.activity: ActivityBuffer = None
+        self.config_listener: ConfigListener = None
+        self.outbound = OutboundScheduler(
+            self,
+            global_rate=OUTBOUND_GLOBAL_RATE,
+            chat_rate=OUTBOUND_CHAT_PER_MINUTE / 60,
+            chat_burst=OUTBOUND_CHAT_BURST,
+            max_in_flight=OUTBOUND_MAX_IN_FLIGHT,
+            max_queue=OUTBOUND_MAX_QUEUE,
+        )
+        self.deletions = DeletionBatcher(self, window=DELETE_BATCH_WINDOW)
+        self.notices = NoticeAggregator(self, window=NOTICE_WINDOW)
+        self.kick_slots = asyncio.Semaphore(KICK_CONCURRENCY)
+        self.metrics: MetricsServer = None
+        if METRICS_PORT:
+            registry.enabled = True
+            registry.add_collector(collector(self))
+            self.metrics = MetricsServer(registry, host=METRICS_HOST, port=METRICS_PORT)
+        raid_monitor.threshold = RAID_THRESHOLD
+        raid_monitor.window = RAID_WINDOW
+        raid_monitor.cooldown = RAID_COOLDOWN
+        load_monitor.degrade_backlog = LOAD_DEGRADE_BACKLOG
+        load_monitor.overload_backlog = LOAD_OVERLOAD_BACKLOG
+        load_monitor.degrade_lag = LOAD_DEGRADE_LAG
+        load_monitor.overload_lag = LOAD_OVERLOAD_LAG
+        load_monitor.recover_after = LOAD_RECOVER_AFTER
+        known_users.maxsize = USER_CACHE_SIZE
+        chat_configs.maxsize = CHAT_CONFIG_CACHE_SIZE
+        chat_configs.ttl = CHAT_CONFIG_TTL
+        member_roles.maxsize = ROLE_CACHE_SIZE
+        member_roles.ttl = ROLE_CACHE_TTL
+        media_cache.directory = Path(MEDIA_CACHE_DIR)
+        media_cache.max_bytes = MEDIA_CACHE_MAX_MB * 1024 ** 2
+        media_cache.queries.ttl = QUERY_CACHE_TTL
+        media_cache.transcode = MEDIA_TRANSCODE
+        extraction_pool.workers = EXTRACTION_WORKERS
+        extraction_pool.max_queue = EXTRACTION_MAX_QUEUE
 
     async def start(self):
         self.log.info("Starting bot...")
         await super().start()
+        self.outbound.start()
+        if isinstance(self.dispatcher, LaneDispatcher):
+            load_monitor.start(self.dispatcher.pressure)
 
         # --- Database Connection ---
         self.log.info("Connecting to the database...")
         try:
-            self.db = await asyncpg.create_pool(
-                user=DB_USER, password=DB_PASS, database=DB_NAME, host=DB_HOST
+            pool = await asyncpg.create_pool(
+                user=DB_USER, password=DB_PASS, database=DB_NAME, host=DB_HOST,
+                init=init_connection,
             )
-            await self.db.execute("SELECT 1")
+            await pool.execute("SELECT 1")
+            self.db = Database(pool)
             self.log.success("Database connection successful.")
         except Exception as e:
             self.log.error(f"Could not connect to database: {e}")
             exit()
 
-        # --- Voice Client Setup ---
-        self.log.info("Starting voice client...")
-        self.voice_client = PyTgCalls(self) # <-- NEW
-        await self.voice_client.start()    # <-- NEW
+        # --- Schema ---
+        try:
+            applied = await run_migrations(self.db.pool)
+            if applied:
+                self.log.success(f"Applied migrations: {applied}")
+            if SCHEMA_CHECK_PLANS:
+                await check_query_plans(self.db.pool)
+        except SchemaError as e:
+            self.log.error(str(e))
+            exit()
+
+        # Lets other bot instances invalidate our cached chat configs
+        self.config_listener = ConfigListener(user=DB_USER, password=DB_PASS, database=DB_NAME, host=DB_HOST)
+        await self.config_listener.start()
+
+        self.activity = ActivityBuffer(
+            self.db, flush_interval=ACTIVITY_FLUSH_INTERVAL, max_size=ACTIVITY_MAX_BUFFER
+        )
+        self.activity.start()
+
+        if self.music:
+            media_cache.load()
+            extraction_pool.start()
+            await music_queues.load(self.db)
+            # Resumes in the background; starts the voice client only if some chat was playing
+            music_queues.restore(self)
+
+        if self.metrics:
+            await self.metrics.start()
 
         me = await self.get_me()
         self.log.success(f"Bot started as {me.first_name} (@{me.username})!")
+        self.log.info(
+            f"Cold start took {time.perf_counter() - PROCESS_STARTED:.2f}s "
+            f"({IMPORTS_DONE - PROCESS_STARTED:.2f}s of it importing), {memory_usage()}"
+        )
+
+    async def get_voice(self) -> LocalVoice | RemoteVoice:
+        """The voice client, started on first use so bots that never play music don't pay for it."""
+        async with self._voice_lock:
+            if self.voice is None:
+                self.log.info("Starting voice client...")
+                started = time.perf_counter()
+                if VOICE_WORKERS > 0:
+                    voice = RemoteVoice(
+                        self, VOICE_WORKERS, API_ID, API_HASH, BOT_TOKEN, pinned=VOICE_PINNED_CHATS
+                    )
+                else:
+                    voice = LocalVoice(self)
+                try:
+                    await voice.start()
+                except Exception as e:
+                    # Nothing is kept, so the next track tries again
+                    self.log.error(f"Voice client failed to start: {e}")
+                    raise
+                self.voice = voice
+                self.log.info(f"Voice client started in {time.perf_counter() - started:.2f}s, {memory_usage()}")
+        return self.voice
 
     async def stop(self):
         self.log.warning("Stopping bot...")
+        if self.metrics:
+            await self.metrics.stop()
+
+        if self.activity:
+            # Write out buffered activity before the pool goes away
+            await self.activity.stop()
+            self.log.info("Activity buffer flushed.")
+
+        self.log.info(f"User cache stats: {known_users.stats()}")
+
+        if self.config_listener:
+            await self.config_listener.stop()
+
+        if self.music:
+            self.log.info(f"Extraction pool stats: {extraction_pool.stats()}")
+            await extraction_pool.stop()
+
         if self.db:
+            log_query_stats(self.db)
             await self.db.close()
             self.log.info("Database connection closed.")
 
-        if self.voice_client.is_running: # <-- NEW
-            await self.voice_client.stop()   # <-- NEW
+        if self.voice:
+            self.log.info(f"Voice stats: {self.voice.stats()}")
+            await self.voice.stop()
+
+        # Pending deletions still go out before the scheduler stops
+        self.deletions.flush_all()
+        self.notices.flush_all()
+        self.log.info(f"Deletion stats: {self.deletions.stats()}, raid stats: {raid_monitor.stats()}")
+        self.log.info(f"Notice stats: {self.notices.stats()}")
+        self.log.info(f"Load stats: {load_monitor.stats()}")
+        await load_monitor.stop()
+        self.log.info(f"Outbound stats: {self.outbound.stats()}")
+        await self.outbound.stop()
 
         await super().stop()
         self.log.info("Bot stopped.")
@@ -89,8 +346,12 @@ async def main():
     finally:
         await bot.stop()
 
-if __name__ == "__main__":
+def run():
+    setup_logging()
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        loguru_logger.info("Bot execution stopped manually.")
\ No newline at end of file
+        loguru_logger.info("Bot execution stopped manually.")
+
+if __name__ == "__main__":
+    run()
\ No newline at end of file
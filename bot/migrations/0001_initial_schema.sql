@@ -0,0 +1,56 @@
+-- 0001: Base schema. Uses IF NOT EXISTS throughout so it also applies cleanly
+-- to databases whose tables were created by hand before migrations existed.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGINT PRIMARY KEY,
+    first_name TEXT,
+    username TEXT,
+    is_bot BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    chat_id BIGINT PRIMARY KEY,
+    title TEXT,
+    config JSONB NOT NULL DEFAULT '{}'::jsonb
+);
+
+-- The primary key serves get_member_role (user_id, chat_id)
+CREATE TABLE IF NOT EXISTS group_members (
+    user_id BIGINT NOT NULL REFERENCES users (user_id),
+    chat_id BIGINT NOT NULL REFERENCES groups (chat_id),
+    role TEXT NOT NULL,
+    PRIMARY KEY (user_id, chat_id)
+);
+
+CREATE TABLE IF NOT EXISTS warnings (
+    warning_id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (user_id),
+    chat_id BIGINT NOT NULL REFERENCES groups (chat_id),
+    warner_id BIGINT NOT NULL REFERENCES users (user_id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- COUNT(*) of a user's warnings in add_warning
+CREATE INDEX IF NOT EXISTS warnings_user_chat_idx ON warnings (user_id, chat_id);
+
+-- The primary key serves get_filter_names and get_filter
+CREATE TABLE IF NOT EXISTS filters (
+    chat_id BIGINT NOT NULL,
+    filter_name TEXT NOT NULL,
+    reply_text TEXT,
+    reply_type TEXT NOT NULL DEFAULT 'text',
+    file_id TEXT,
+    PRIMARY KEY (chat_id, filter_name)
+);
+
+-- No foreign keys here: rows arrive in batches from the activity buffer
+CREATE TABLE IF NOT EXISTS group_activity (
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 1,
+    last_message_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (chat_id, user_id)
+);
+
+-- Top-N scan for get_top_active_users
+CREATE INDEX IF NOT EXISTS group_activity_top_idx ON group_activity (chat_id, message_count DESC);
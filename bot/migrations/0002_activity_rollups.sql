@@ -0,0 +1,50 @@
+-- 0002: Time-bucketed activity rollups, written by the activity buffer next to
+-- group_activity. Per-user tables answer /topusers for a period, per-chat
+-- tables and the lifetime totals answer /stats.
+
+CREATE TABLE IF NOT EXISTS user_activity_hourly (
+    chat_id BIGINT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    user_id BIGINT NOT NULL,
+    message_count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, bucket, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_activity_daily (
+    chat_id BIGINT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    user_id BIGINT NOT NULL,
+    message_count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, bucket, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS chat_activity_hourly (
+    chat_id BIGINT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    message_count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS chat_activity_daily (
+    chat_id BIGINT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    message_count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS chat_activity_totals (
+    chat_id BIGINT PRIMARY KEY,
+    message_count BIGINT NOT NULL
+);
+
+-- Retention pruning deletes by bucket across all chats
+CREATE INDEX IF NOT EXISTS user_activity_hourly_bucket_idx ON user_activity_hourly (bucket);
+CREATE INDEX IF NOT EXISTS user_activity_daily_bucket_idx ON user_activity_daily (bucket);
+CREATE INDEX IF NOT EXISTS chat_activity_hourly_bucket_idx ON chat_activity_hourly (bucket);
+CREATE INDEX IF NOT EXISTS chat_activity_daily_bucket_idx ON chat_activity_daily (bucket);
+
+-- Lifetime totals start from what group_activity already counted.
+-- There is no history to backfill the hourly and daily rollups from.
+INSERT INTO chat_activity_totals (chat_id, message_count)
+SELECT chat_id, SUM(message_count) FROM group_activity GROUP BY chat_id
+ON CONFLICT (chat_id) DO NOTHING;
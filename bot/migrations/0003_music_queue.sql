@@ -0,0 +1,22 @@
+-- 0003: Write-through store for the music queues, so a restart can resume them.
+-- position is a float so a moved entry gets a value between its new neighbours
+-- and no other row has to be renumbered.
+
+CREATE TABLE IF NOT EXISTS music_queue (
+    entry_id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    position DOUBLE PRECISION NOT NULL,
+    query TEXT NOT NULL,
+    title TEXT,
+    requester TEXT,
+    video_id TEXT
+);
+
+CREATE INDEX IF NOT EXISTS music_queue_chat_position_idx ON music_queue (chat_id, position);
+
+-- One row per chat that is playing something right now
+CREATE TABLE IF NOT EXISTS music_state (
+    chat_id BIGINT PRIMARY KEY,
+    now_playing JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -4,7 +4,8 @@ from pyrogram.types import Message
 @Client.on_message(filters.command("start") & filters.private)
 async def start_private(client: "Bot", message: Message):
     """Handler for the /start command in private chats."""
-    await message.reply_text(
+    await client.outbound.reply(
+        message,
         f"Hello {message.from_user.mention}! I am your friendly group manager bot.\n"
         "Add me to a group and make me an admin to get started."
     )
@@ -16,4 +17,4 @@ async def help_command(client: "Bot", message: Message):
         "**🤖 Bot Help**\n\n"
         "I am a group management and music bot. My commands are organized into modules."
     )
-    await message.reply_text(help_text)
\ No newline at end of file
+    await client.outbound.reply(message, help_text)
\ No newline at end of file
@@ -3,20 +3,24 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 
 from bot.core.decorators import require_role
-from bot.core.database import Role, add_filter, remove_filter, get_all_filters
+from bot.core.database import Role
+from bot.core.context import get_chat_context
+from bot.core.outbound import Priority
+from bot.core.raid import raid_monitor
+from bot.core.load import Criticality, criticality
 
 @Client.on_message(filters.group & filters.command("addfilter"))
 @require_role(Role.ADMIN)
 async def add_filter_command(client: "Bot", message: Message):
     if not message.reply_to_message:
-        await message.reply_text("Please reply to a message to set it as a filter reply.")
+        await client.outbound.reply(message, "Please reply to a message to set it as a filter reply.")
         return
 
     # The trigger is the word after /addfilter
     try:
         filter_name = message.command[1].lower()
     except IndexError:
-        await message.reply_text("Usage: `/addfilter <trigger>` while replying to a message.")
+        await client.outbound.reply(message, "Usage: `/addfilter <trigger>` while replying to a message.")
         return
 
     reply_message = message.reply_to_message
@@ -32,8 +36,8 @@ async def add_filter_command(client: "Bot", message: Message):
         file_id = reply_message.photo.file_id
     # Add more types like video, document, etc. as needed
 
-    await add_filter(client.db, message.chat.id, filter_name, reply_text, reply_type, file_id)
-    await message.reply_text(f"✅ Filter `{filter_name}` saved.")
+    await client.db.add_filter(message.chat.id, filter_name, reply_text, reply_type, file_id)
+    await client.outbound.reply(message, f"✅ Filter `{filter_name}` saved.")
 
 
 @Client.on_message(filters.group & filters.command(["delfilter", "stop"]))
@@ -42,46 +46,59 @@ async def remove_filter_command(client: "Bot", message: Message):
     try:
         filter_name = message.command[1].lower()
     except IndexError:
-        await message.reply_text("Usage: `/delfilter <trigger>`")
+        await client.outbound.reply(message, "Usage: `/delfilter <trigger>`")
         return
 
-    await remove_filter(client.db, message.chat.id, filter_name)
-    await message.reply_text(f"✅ Filter `{filter_name}` removed.")
+    await client.db.remove_filter(message.chat.id, filter_name)
+    await client.outbound.reply(message, f"✅ Filter `{filter_name}` removed.")
 
 
 @Client.on_message(filters.group & filters.command("filters"))
 async def list_filters_command(client: "Bot", message: Message):
-    all_filters = await get_all_filters(client.db, message.chat.id)
+    all_filters = await client.db.get_filter_names(message.chat.id)
     if not all_filters:
-        await message.reply_text("There are no filters in this chat.")
+        await client.outbound.reply(message, "There are no filters in this chat.")
         return
 
-    filter_names = [f"`{f['filter_name']}`" for f in all_filters]
-    await message.reply_text("Available filters in this chat:\n" + "\n".join(filter_names))
+    filter_names = [f"`{name}`" for name in all_filters]
+    await client.outbound.reply(message, "Available filters in this chat:\n" + "\n".join(filter_names))
 
 
 # This handler will check every message for a filter trigger
 # The group=2 makes it run after the lock handler but before normal command handlers
 @Client.on_message(filters.group & filters.text, group=2)
+@criticality(Criticality.BEST_EFFORT)
 async def filter_enforcement_handler(client: "Bot", message: Message):
     # This new line makes the function exit immediately if the message is a command
     if message.text and message.text.startswith("/"):
         return
 
-    all_filters = await get_all_filters(client.db, message.chat.id)
-    if not all_filters:
+    # Nobody gets answered while the chat is being raided
+    if raid_monitor.active(message.chat.id):
         return
 
-    for f in all_filters:
-        # Using f" {f['filter_name']} " ensures we match whole words
-        if f" {f['filter_name']} " in f" {message.text.lower()} ":
-            reply_type = f['reply_type']
+    # The index comes from the per-update context and only holds trigger names
+    context = await get_chat_context(client, message)
+    filter_name = context.filter_index.find(message.text)
+    if not filter_name:
+        return
 
-            if reply_type == "text":
-                await message.reply_text(f['reply_text'], quote=False)
-            elif reply_type == "sticker":
-                await message.reply_sticker(f['file_id'], quote=False)
-            elif reply_type == "photo":
-                await message.reply_photo(f['file_id'], caption=f['reply_text'], quote=False)
+    f = await client.db.get_filter(message.chat.id, filter_name)
+    if not f:
+        return
 
-            break
\ No newline at end of file
+    # The same filter firing again before its reply went out is only answered once
+    key = ("filter", message.chat.id, filter_name)
+    reply_type = f['reply_type']
+    if reply_type == "text":
+        client.outbound.reply(message, f['reply_text'], priority=Priority.FILTER, key=key, quote=False)
+    elif reply_type == "sticker":
+        client.outbound.submit(
+            message.chat.id, Priority.FILTER, message.reply_sticker, f['file_id'],
+            key=key, is_message=True, quote=False,
+        )
+    elif reply_type == "photo":
+        client.outbound.submit(
+            message.chat.id, Priority.FILTER, message.reply_photo, f['file_id'],
+            key=key, is_message=True, caption=f['reply_text'], quote=False,
+        )
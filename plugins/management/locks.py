@@ -4,7 +4,10 @@ from pyrogram.types import Message
 from pyrogram.enums import ChatType
 
 from bot.core.decorators import require_role
-from bot.core.database import Role, set_group_lock, get_group_locks, get_member_role
+from bot.core.context import get_chat_context
+from bot.core.database import Role
+from bot.core.raid import RAID_LOCKS, raid_monitor, record_violation
+from bot.core.load import Criticality, criticality
 
 VALID_LOCKS = ["media", "links", "all"] # "all" locks everything
 
@@ -12,9 +15,10 @@ VALID_LOCKS = ["media", "links", "all"] # "all" locks everything
 
 @Client.on_message(filters.group & filters.command(["lock", "unlock"]))
 @require_role(Role.ADMIN)
+@criticality(Criticality.CRITICAL)
 async def lock_unlock_command(client: "Bot", message: Message):
     if len(message.command) < 2 or message.command[1] not in VALID_LOCKS:
-        await message.reply_text(f"Invalid usage. Valid locks: {', '.join(VALID_LOCKS)}")
+        await client.outbound.reply(message, f"Invalid usage. Valid locks: {', '.join(VALID_LOCKS)}")
         return
 
     lock_type = message.command[1]
@@ -24,43 +28,53 @@ async def lock_unlock_command(client: "Bot", message: Message):
     if lock_type == "all":
         for lock in VALID_LOCKS:
             if lock != "all":
-                await set_group_lock(client.db, message.chat.id, lock, is_locking)
+                await client.db.set_group_lock(message.chat.id, lock, is_locking)
     else:
-        await set_group_lock(client.db, message.chat.id, lock_type, is_locking)
+        await client.db.set_group_lock(message.chat.id, lock_type, is_locking)
 
-    await message.reply_text(f"✅ Successfully **{status_text}** `{lock_type}`.")
+    await client.outbound.reply(message, f"✅ Successfully **{status_text}** `{lock_type}`.")
 
 # --- Enforcement Handler ---
 
 # The group=-1 makes this handler run before others.
 # This is crucial for catching and deleting messages before they are processed by other plugins.
 @Client.on_message(filters.group, group=-1)
+@criticality(Criticality.CRITICAL)
 async def enforcement_handler(client: "Bot", message: Message):
     # We don't want to check messages from private chats or channels
     if message.chat.type != ChatType.SUPERGROUP:
         return
 
-    # Admins are immune to locks
-    user_role = await get_member_role(client.db, message.from_user.id, message.chat.id)
-    if message.from_user and (message.from_user.id == client.owner_id or (user_role and user_role.value >= Role.ADMIN.value)):
-         return
-
-    locks = await get_group_locks(client.db, message.chat.id)
+    # Locks and the sender's role come from the per-update context
+    context = await get_chat_context(client, message)
+    locks = context.locks
+    # A chat under attack gets stricter locks until the wave passes
+    if raid_monitor.active(message.chat.id):
+        locks = {**locks, **RAID_LOCKS}
     if not locks:
         return
 
+    # Admins are immune to locks
+    if message.from_user and (message.from_user.id == client.owner_id or context.has_role(Role.ADMIN)):
+        return
+
     # Lock "all" is a catch-all
     if locks.get("all", False):
-        await message.delete()
-        return
+        remove_violation(client, message)
 
     # Lock specific message types
     if locks.get("links", False) and (message.text or message.caption):
         text = message.text or message.caption
         if "http://" in text or "https://" in text or "t.me" in text:
-            await message.delete()
-            return
+            remove_violation(client, message)
 
     if locks.get("media", False) and (message.photo or message.video or message.document or message.sticker):
-        await message.delete()
-        return
\ No newline at end of file
+        remove_violation(client, message)
+
+def remove_violation(client: "Bot", message: Message):
+    """Deletes a message that broke a lock, counts it towards raid mode and stops its handling."""
+    # Deletions are batched per chat and not waited for
+    client.deletions.delete(message)
+    record_violation(client, message.chat.id)
+    # A deleted message shouldn't be counted or answered by later handler groups
+    message.stop_propagation()
@@ -3,50 +3,77 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 
 from bot.core.decorators import require_role
-from bot.core.database import Role, log_user_activity, get_top_active_users, get_total_group_messages, add_user_if_not_exists
+from bot.core.database import ACTIVITY_PERIODS, Role
+from bot.core.outbound import Priority
+from bot.core.load import Criticality, criticality
 
 # --- Activity Logger ---
 # This handler runs for every message to log user activity.
-# group=-3 makes it run after moderation but before other things.
-@Client.on_message(filters.group, group=-3)
+# group=1 makes it run after lock enforcement (group=-1), so messages deleted
+# there stop propagating and are never counted.
+@Client.on_message(filters.group, group=1)
+@criticality(Criticality.BEST_EFFORT)
 async def activity_logger(client: "Bot", message: Message):
     if message.from_user and not message.from_user.is_bot:
         # Ensure user exists in the 'users' table first
-        await add_user_if_not_exists(
-            client.db,
+        await client.db.add_user_if_not_exists(
             message.from_user.id,
             message.from_user.first_name,
             message.from_user.username,
             message.from_user.is_bot
         )
-        # Log the activity
-        await log_user_activity(client.db, message.chat.id, message.from_user.id)
+        # Count the message; the buffer writes it to the database in batches
+        client.activity.record(message.chat.id, message.from_user.id)
 
 # --- Stats Commands ---
 
+def parse_period_arg(message: Message):
+    """Returns (period, error). No argument means the chat's whole lifetime."""
+    if len(message.command) < 2:
+        return None, None
+    period = message.command[1].lower()
+    if period not in ACTIVITY_PERIODS:
+        return None, f"Invalid period. Valid periods: {', '.join(ACTIVITY_PERIODS)}"
+    return period, None
+
 @Client.on_message(filters.group & filters.command("stats"))
 @require_role(Role.ADMIN)
 async def group_stats_command(client: "Bot", message: Message):
+    period, error = parse_period_arg(message)
+    if error:
+        await client.outbound.reply(message, error)
+        return
+
     chat_id = message.chat.id
-    total_messages = await get_total_group_messages(client.db, chat_id)
-    total_members = await client.get_chat_members_count(chat_id)
+    total_messages = await client.db.get_total_group_messages(chat_id, period=period)
+    total_members = await client.outbound.submit(chat_id, Priority.COMMAND, client.get_chat_members_count, chat_id)
+    if total_members is None:
+        # The scheduler dropped the call under load
+        total_members = "unknown"
 
-    await message.reply_text(
+    messages_label = f"Messages ({period})" if period else "Total Messages"
+    await client.outbound.reply(
+        message,
         f"📊 **Group Statistics**\n\n"
         f"👥 Total Members: `{total_members}`\n"
-        f"💬 Total Messages: `{total_messages}`"
+        f"💬 {messages_label}: `{total_messages}`"
     )
 
 @Client.on_message(filters.group & filters.command("topusers"))
 @require_role(Role.ADMIN)
 async def top_users_command(client: "Bot", message: Message):
-    top_users = await get_top_active_users(client.db, message.chat.id)
+    period, error = parse_period_arg(message)
+    if error:
+        await client.outbound.reply(message, error)
+        return
+
+    top_users = await client.db.get_top_active_users(message.chat.id, period=period)
     if not top_users:
-        await message.reply_text("No activity has been recorded yet.")
+        await client.outbound.reply(message, "No activity has been recorded yet.")
         return
 
-    text = "🏆 **Top 5 Active Users**\n\n"
+    text = f"🏆 **Top 5 Active Users ({period})**\n\n" if period else "🏆 **Top 5 Active Users**\n\n"
     for i, user in enumerate(top_users, 1):
         text += f"{i}. {user['first_name']} - `{user['message_count']}` messages\n"
 
-    await message.reply_text(text)
\ No newline at end of file
+    await client.outbound.reply(message, text)
@@ -1,10 +1,17 @@
 # plugins/moderation/anti_bot.py
-import re
+import asyncio
+
 from pyrogram import Client, filters
 from pyrogram.types import Message
 
 from bot.core.decorators import require_role
-from bot.core.database import Role, add_banned_name_pattern, remove_banned_name_pattern, get_banned_name_patterns
+from bot.core.database import Role
+from bot.core.context import get_chat_context
+from bot.core.name_matcher import get_name_matcher, invalidate_name_matcher, validate_pattern
+from bot.core.notices import list_names
+from bot.core.outbound import Priority
+from bot.core.raid import record_violation
+from bot.core.load import Criticality, criticality
 
 # --- Management Commands ---
 
@@ -12,55 +19,83 @@ from bot.core.database import Role, add_banned_name_pattern, remove_banned_name_
 @require_role(Role.MANAGER)
 async def add_banned_name_command(client: "Bot", message: Message):
     if len(message.command) < 2:
-        await message.reply_text("Usage: `/addbanname <pattern>`")
+        await client.outbound.reply(message, "Usage: `/addbanname <pattern>`")
         return
 
     pattern = " ".join(message.command[1:])
-    await add_banned_name_pattern(client.db, message.chat.id, pattern)
-    await message.reply_text(f"✅ Added `{pattern}` to the banned name list.")
+    # Patterns run on every join, so reject anything invalid or slow up front
+    error = validate_pattern(pattern)
+    if error:
+        await client.outbound.reply(message, f"❌ Can't use `{pattern}`: {error}")
+        return
+
+    await client.db.add_banned_name_pattern(message.chat.id, pattern)
+    invalidate_name_matcher(message.chat.id)
+    await client.outbound.reply(message, f"✅ Added `{pattern}` to the banned name list.")
 
 @Client.on_message(filters.group & filters.command("delbanname"))
 @require_role(Role.MANAGER)
 async def remove_banned_name_command(client: "Bot", message: Message):
     if len(message.command) < 2:
-        await message.reply_text("Usage: `/delbanname <pattern>`")
+        await client.outbound.reply(message, "Usage: `/delbanname <pattern>`")
         return
 
     pattern = " ".join(message.command[1:])
-    await remove_banned_name_pattern(client.db, message.chat.id, pattern)
-    await message.reply_text(f"✅ Removed `{pattern}` from the banned name list.")
+    await client.db.remove_banned_name_pattern(message.chat.id, pattern)
+    invalidate_name_matcher(message.chat.id)
+    await client.outbound.reply(message, f"✅ Removed `{pattern}` from the banned name list.")
 
 @Client.on_message(filters.group & filters.command("bannednames"))
 async def list_banned_names_command(client: "Bot", message: Message):
-    patterns = await get_banned_name_patterns(client.db, message.chat.id)
+    patterns = await client.db.get_banned_name_patterns(message.chat.id)
     if not patterns:
-        await message.reply_text("There are no banned name patterns set for this group.")
+        await client.outbound.reply(message, "There are no banned name patterns set for this group.")
         return
 
     text = "Banned Name Patterns:\n" + "\n".join([f"- `{p}`" for p in patterns])
-    await message.reply_text(text)
+    await client.outbound.reply(message, text)
 
 
 # --- Enforcement Handler for New Members ---
 
+def _kicked_summary(mentions: list) -> str:
+    return f"👢 Kicked {len(mentions)} member(s) for having a suspicious name: {list_names(mentions)}"
+
+def _failed_summary(failures: list) -> str:
+    return f"⚠️ Couldn't kick {len(failures)} member(s): {list_names(failures)}"
+
+async def _kick(client: "Bot", message: Message, member):
+    """Kicks one member. Failures are reported in the summary instead of stopping the others."""
+    chat_id = message.chat.id
+    # Bounded by KICK_CONCURRENCY across all join messages
+    async with client.kick_slots:
+        try:
+            await client.outbound.submit(chat_id, Priority.MODERATION, message.chat.ban_member, member.id)
+        except Exception as e:
+            client.notices.add(chat_id, "anti_bot_failed", f"{member.mention} ({e})", _failed_summary)
+            return
+        record_violation(client, chat_id)
+        client.notices.add(chat_id, "anti_bot_kicked", member.mention, _kicked_summary)
+        try:
+            # Lifting the ban right away makes it a kick, so they can rejoin
+            await client.outbound.submit(chat_id, Priority.MODERATION, message.chat.unban_member, member.id)
+        except Exception as e:
+            client.log.warning(f"Kicked {member.id} from {chat_id} but could not lift the ban: {e}")
+
 @Client.on_message(filters.new_chat_members, group=-2)
+@criticality(Criticality.CRITICAL)
 async def anti_bot_handler(client: "Bot", message: Message):
-    patterns = await get_banned_name_patterns(client.db, message.chat.id)
+    context = await get_chat_context(client, message)
+    patterns = context.banned_names
     if not patterns:
         return
 
-    for member in message.new_chat_members:
-        full_name = f"{member.first_name} {member.last_name or ''}".lower()
-
-        for pattern in patterns:
-            if re.search(pattern.lower(), full_name):
-                try:
-                    # Kick the user and notify the chat
-                    await message.chat.ban_member(member.id)
-                    await message.chat.unban_member(member.id)
-                    await message.reply_text(
-                        f"👢 Kicked {member.mention} for having a suspicious name."
-                    )
-                except Exception as e:
-                    await message.reply_text(f"Error kicking bot: {e}")
-                break # Stop checking patterns for this user
\ No newline at end of file
+    # Compiled once per pattern list and cached per chat
+    matcher = get_name_matcher(message.chat.id, patterns)
+
+    matches = [
+        member for member in message.new_chat_members
+        if matcher.matches(f"{member.first_name} {member.last_name or ''}")
+    ]
+    if matches:
+        await asyncio.gather(*(_kick(client, message, member) for member in matches))
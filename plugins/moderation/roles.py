@@ -1,13 +1,7 @@
 # plugins/moderation/roles.py
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from bot.core.database import (
-    add_user_if_not_exists,
-    add_group_if_not_exists,
-    set_member_role,
-    remove_member_role,
-    Role
-)
+from bot.core.database import Role
 from bot.core.decorators import require_role
 
 # A helper to map command text to Role objects
@@ -22,7 +16,7 @@ ROLE_MAP = {
 @require_role(Role.OWNER)  # Only the group owner can promote others
 async def promote_member(client: "Bot", message: Message):
     if not message.reply_to_message or not message.reply_to_message.from_user:
-        await message.reply_text("Please reply to a user's message to promote them.")
+        await client.outbound.reply(message, "Please reply to a user's message to promote them.")
         return
 
     chat_id = message.chat.id
@@ -32,13 +26,14 @@ async def promote_member(client: "Bot", message: Message):
     role_to_set = ROLE_MAP.get(command)
 
     # Add the group and user to our database if they aren't there yet
-    await add_group_if_not_exists(client.db, chat_id, chat_title)
-    await add_user_if_not_exists(client.db, promoted_user.id, promoted_user.first_name, promoted_user.username, promoted_user.is_bot)
+    await client.db.add_group_if_not_exists(chat_id, chat_title)
+    await client.db.add_user_if_not_exists(promoted_user.id, promoted_user.first_name, promoted_user.username, promoted_user.is_bot)
 
     # Set the role in the database
-    await set_member_role(client.db, promoted_user.id, chat_id, role_to_set)
+    await client.db.set_member_role(promoted_user.id, chat_id, role_to_set)
 
-    await message.reply_text(
+    await client.outbound.reply(
+        message,
         f"✅ Successfully promoted {promoted_user.mention} to **{role_to_set.name.capitalize()}**."
     )
 
@@ -46,14 +41,15 @@ async def promote_member(client: "Bot", message: Message):
 @require_role(Role.OWNER)  # Only the group owner can demote others
 async def demote_member(client: "Bot", message: Message):
     if not message.reply_to_message or not message.reply_to_message.from_user:
-        await message.reply_text("Please reply to a user's message to demote them.")
+        await client.outbound.reply(message, "Please reply to a user's message to demote them.")
         return
 
     chat_id = message.chat.id
     demoted_user = message.reply_to_message.from_user
 
-    await remove_member_role(client.db, demoted_user.id, chat_id)
+    await client.db.remove_member_role(demoted_user.id, chat_id)
 
-    await message.reply_text(
+    await client.outbound.reply(
+        message,
         f"✅ Successfully demoted {demoted_user.mention}. They now have no special role."
     )
\ No newline at end of file
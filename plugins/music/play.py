@@ -1,73 +1,231 @@
 # plugins/music/play.py
-import os
+import asyncio
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from py_tgcalls.types import AudioPiped
 
 from bot.core.decorators import require_role
 from bot.core.database import Role
-from bot.core.music_helpers import get_queue, add_to_queue, get_next_song, download_song
+from bot.core.music_helpers import (
+    MAX_SEARCH_RESULTS, is_playlist, iter_tracks, media_cache, music_queues, prefetch, prepare, release_song,
+)
+from bot.core.music_queue import new_entry
+from bot.core.voice import on_stream_end
 
-# --- In-memory state to track if a chat is playing ---
-PLAYING_STATE = {}
+# One start_playback() at a time per chat, so a stream end and a /play can't both pop the queue
+PLAYBACK_LOCKS = {}
+
+# Playback and listing started from commands; held so they can't be garbage-collected while running
+BACKGROUND_TASKS = set()
+
+def run_in_background(client: "Bot", coro, what: str):
+    """Runs a coroutine without waiting for it, logging it if it fails."""
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    task.add_done_callback(lambda t: _log_failure(client, t, what))
+
+def _log_failure(client: "Bot", task: asyncio.Task, what: str):
+    if not task.cancelled() and task.exception():
+        client.log.error(f"{what} failed: {task.exception()}")
 
 async def start_playback(client: "Bot", chat_id: int):
     """The main function to start playing the next song in the queue."""
-    song = get_next_song(chat_id)
-    if not song:
-        # If queue is empty, leave the voice chat
-        await client.voice_client.leave_group_call(chat_id)
-        PLAYING_STATE[chat_id] = False
-        return
+    async with PLAYBACK_LOCKS.setdefault(chat_id, asyncio.Lock()):
+        await _play_next(client, chat_id)
 
-    PLAYING_STATE[chat_id] = True
+async def ensure_playing(client: "Bot", chat_id: int):
+    """Starts playback unless the chat is already playing."""
+    async with PLAYBACK_LOCKS.setdefault(chat_id, asyncio.Lock()):
+        if not music_queues.get(chat_id).playing:
+            await _play_next(client, chat_id)
 
-    try:
-        # Join the voice chat
-        await client.voice_client.join_group_call(
-            chat_id,
-            AudioPiped(song['path']),
-        )
-        await client.send_message(chat_id, f"▶️ Now Playing: **{song['title']}**")
-    except Exception as e:
-        await client.send_message(chat_id, f"Error playing song: {e}")
+# Chats that were playing when the bot stopped pick up where they left off
+music_queues.on_restore = ensure_playing
+
+async def _play_next(client: "Bot", chat_id: int):
+    # Callers hold the chat's playback lock
+    in_call = music_queues.get(chat_id).playing
+    while True:
+        song = await music_queues.pop(chat_id)
+        if not song:
+            # If queue is empty, leave the voice chat
+            if in_call:
+                await client.voice.leave(chat_id)
+            await music_queues.finish(chat_id)
+            return
+
+        # Start downloading the songs after this one while it plays
+        prefetch(chat_id)
+
+        try:
+            # Usually done already by the prefetch, so this returns at once
+            await prepare(chat_id, song)
+        except Exception as e:
+            client.outbound.send(chat_id, f"⚠️ Couldn't load `{song['query']}`: {e}\nSkipping it.")
+            continue
+
+        try:
+            # Joins the voice chat, or switches streams if still in it from the previous song
+            voice = await client.get_voice()
+            await voice.play(chat_id, song['path'], song['format'])
+            # Tracks skipped in quick succession only announce the one that stuck
+            client.outbound.send(chat_id, f"▶️ Now Playing: **{song['title']}**", key=("now_playing", chat_id))
+        except Exception as e:
+            if not in_call:
+                # Never made it into the voice chat
+                await music_queues.finish(chat_id)
+            client.outbound.send(chat_id, f"Error playing song: {e}")
+        finally:
+            # The file is open by now (or won't be needed), so the cache may evict it
+            media_cache.unpin(song['video_id'])
+        return
 
-# --- PyTgCalls Event Listener ---
-# This function runs automatically when a song finishes playing
-@Client.on_raw_update()
-async def on_stream_end(client: "Bot", update, users, chats):
-    if not isinstance(getattr(update, 'message', None), Message) and \
-       hasattr(update, 'chat_id') and hasattr(update, 'stream_id'):
-        chat_id = update.chat_id
-        if PLAYING_STATE.get(chat_id):
-            # Start playing the next song
-            await start_playback(client, chat_id)
+# --- Voice Events ---
+# Runs when a song finishes playing, whether the voice client is in this process or a worker
+@on_stream_end
+async def stream_ended(client: "Bot", chat_id: int):
+    if music_queues.get(chat_id).playing:
+        # Start playing the next song
+        await start_playback(client, chat_id)
 
 
 # --- Play Command ---
 @Client.on_message(filters.group & filters.command("play"))
 @require_role(Role.ADMIN)
 async def play_command(client: "Bot", message: Message):
-    if len(message.command) < 2:
-        await message.reply_text("Usage: `/play <song name or youtube link>`")
+    args = message.command[1:]
+    count = 1
+    if len(args) >= 3 and args[0] == "-n" and args[1].isdigit():
+        count = max(1, min(int(args[1]), MAX_SEARCH_RESULTS))
+        args = args[2:]
+    if not args:
+        await client.outbound.reply(
+            message,
+            "Usage: `/play <song name, youtube link or playlist link>`\n"
+            f"or `/play -n <1-{MAX_SEARCH_RESULTS}> <search>` to queue several results."
+        )
         return
 
-    query = " ".join(message.command[1:])
-    await message.reply_text(f"Searching for `{query}`...")
+    query = " ".join(args)
+    chat_id = message.chat.id
 
-    try:
-        song_info = await download_song(query)
-        add_to_queue(
-            chat_id=message.chat.id,
-            title=song_info['title'],
-            path=song_info['path'],
-            requester=message.from_user.mention
-        )
-        await message.reply_text(f"✅ Added to queue: **{song_info['title']}**")
+    if count > 1 or is_playlist(query):
+        # Listed page by page in the background; playback starts with the first track
+        run_in_background(client, _enqueue_many(client, message, query, count), f"Queuing {query!r} in {chat_id}")
+        await client.outbound.reply(message, f"📜 Fetching `{query}`...")
+        return
+
+    # Queue it right away; the download runs in the background
+    position = await music_queues.append(chat_id, new_entry(query, message.from_user.mention))
+    prefetch(chat_id)
+    await client.outbound.reply(message, f"✅ Queued `{query}` at position {position}.")
 
-        # If nothing is currently playing, start playback
-        if not PLAYING_STATE.get(message.chat.id):
-            await start_playback(client, message.chat.id)
+    # If nothing is currently playing, start playback
+    if not music_queues.get(chat_id).playing:
+        run_in_background(client, ensure_playing(client, chat_id), f"Starting playback in {chat_id}")
 
+async def _enqueue_many(client: "Bot", message: Message, query: str, count: int):
+    """Queues every track of a playlist or search as soon as it is listed."""
+    chat_id = message.chat.id
+    queued = 0
+    try:
+        async for track in iter_tracks(chat_id, query, count):
+            entry = new_entry(track['url'], message.from_user.mention, title=track['title'], video_id=track['id'])
+            await music_queues.append(chat_id, entry)
+            queued += 1
+            prefetch(chat_id)
+            if queued == 1 and not music_queues.get(chat_id).playing:
+                run_in_background(client, ensure_playing(client, chat_id), f"Starting playback in {chat_id}")
     except Exception as e:
-        await message.reply_text(f"Error: {e}")
\ No newline at end of file
+        await client.outbound.reply(message, f"⚠️ Stopped listing `{query}` after {queued} tracks: {e}")
+        return
+
+    if queued:
+        await client.outbound.reply(message, f"✅ Queued {queued} tracks from `{query}`.")
+    else:
+        await client.outbound.reply(message, f"No tracks found for `{query}`.")
+
+
+# --- Queue Commands ---
+@Client.on_message(filters.group & filters.command("queue"))
+async def queue_command(client: "Bot", message: Message):
+    queue = music_queues.get(message.chat.id)
+    if not queue.playing and not queue.entries:
+        await client.outbound.reply(message, "The queue is empty.")
+        return
+
+    lines = []
+    if queue.now_playing:
+        lines.append(f"▶️ **{queue.now_playing['title']}** — {queue.now_playing['requester']}")
+    for position, song in enumerate(queue.entries, start=1):
+        if position > 20:
+            lines.append(f"…and {len(queue.entries) - 20} more")
+            break
+        lines.append(f"{position}. {song['title']} — {song['requester']}")
+    await client.outbound.reply(message, "\n".join(lines))
+
+@Client.on_message(filters.group & filters.command("skip"))
+@require_role(Role.ADMIN)
+async def skip_command(client: "Bot", message: Message):
+    chat_id = message.chat.id
+    if not music_queues.get(chat_id).playing:
+        await client.outbound.reply(message, "Nothing is playing.")
+        return
+    await client.outbound.reply(message, "⏭ Skipped.")
+    await start_playback(client, chat_id)
+
+@Client.on_message(filters.group & filters.command("stop"))
+@require_role(Role.ADMIN)
+async def stop_command(client: "Bot", message: Message):
+    """Stops playback, leaves the voice chat and empties the queue, in memory and in the database."""
+    chat_id = message.chat.id
+    async with PLAYBACK_LOCKS.setdefault(chat_id, asyncio.Lock()):
+        playing = music_queues.get(chat_id).now_playing
+        removed = await music_queues.clear(chat_id)
+        if playing is not None and client.voice:
+            try:
+                await client.voice.leave(chat_id)
+            except Exception as e:
+                client.log.warning(f"Could not leave the voice chat in {chat_id}: {e}")
+    if not removed:
+        await client.outbound.reply(message, "Nothing is playing.")
+        return
+    for song in removed:
+        # The playing song's cache pin was already released when it started
+        if song is not playing:
+            release_song(song)
+    await client.outbound.reply(message, f"⏹ Stopped and cleared {len(removed)} song(s).")
+
+@Client.on_message(filters.group & filters.command("move"))
+@require_role(Role.ADMIN)
+async def move_command(client: "Bot", message: Message):
+    try:
+        src, dst = (int(arg) for arg in message.command[1:3])
+    except ValueError:
+        await client.outbound.reply(message, "Usage: `/move <from> <to>`")
+        return
+
+    try:
+        song = await music_queues.move(message.chat.id, src - 1, dst - 1)
+    except IndexError:
+        await client.outbound.reply(message, "There is no song at that position.")
+        return
+    await client.outbound.reply(message, f"↕️ Moved **{song['title']}** to position {dst}.")
+
+@Client.on_message(filters.group & filters.command("remove"))
+@require_role(Role.ADMIN)
+async def remove_command(client: "Bot", message: Message):
+    if len(message.command) < 2 or not message.command[1].isdigit():
+        await client.outbound.reply(message, "Usage: `/remove <position>`")
+        return
+
+    position = int(message.command[1])
+    try:
+        if position < 1:
+            raise IndexError
+        song = await music_queues.remove(message.chat.id, position - 1)
+    except IndexError:
+        await client.outbound.reply(message, "There is no song at that position.")
+        return
+    release_song(song)
+    await client.outbound.reply(message, f"🗑 Removed **{song['title']}** from the queue.")